@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+import pandas as pd
+import typer
+from google.ads.googleads.client import GoogleAdsClient
+from google_ads.google_ads import REPORT_COLUMNS
+from utils.google_ads_helper import rows_to_dataframe
+from utils.schemas import google_dtypes
+
+app = typer.Typer(help="Benchmark GoogleAdsRow to DataFrame conversion")
+
+
+def make_rows(n_rows: int, use_proto_plus: bool) -> list:
+    client = GoogleAdsClient(None, "benchmark", use_proto_plus=use_proto_plus)
+    rows = []
+    for i in range(n_rows):
+        row = client.get_type("GoogleAdsRow")
+        row.segments.date = f"2024-01-{i % 28 + 1:02d}"
+        row.customer.id = 1234567890
+        row.customer.currency_code = "IDR"
+        row.campaign.id = 10_000_000 + i % 500
+        row.campaign.name = f"campaign {i % 500}"
+        row.metrics.impressions = i + 1
+        row.metrics.clicks = i % 97
+        row.metrics.video_views = i % 13
+        row.metrics.engagements = i % 7
+        row.metrics.conversions = i % 5 * 0.5
+        row.metrics.all_conversions = i % 5 * 0.75
+        row.metrics.view_through_conversions = i % 3
+        row.metrics.cost_micros = i * 1000
+        row.metrics.ctr = 0.01
+        row.metrics.average_cpc = 1500.0
+        row.metrics.absolute_top_impression_percentage = 0.4
+        row.metrics.top_impression_percentage = 0.6
+        row.metrics.cost_per_conversion = 2500.0
+        rows.append(row)
+    return rows
+
+
+def rows_to_dataframe_legacy(rows) -> pd.DataFrame:
+    # The dict-per-row conversion that rows_to_dataframe replaced
+    all_reports = []
+    for row in rows:
+        all_reports.append(
+            {
+                "date": row.segments.date,
+                "customer_id": row.customer.id,
+                "campaign_id": row.campaign.id,
+                "campaign_name": row.campaign.name,
+                "currency_code": row.customer.currency_code,
+                "impressions": row.metrics.impressions,
+                "clicks": row.metrics.clicks,
+                "video_views": row.metrics.video_views,
+                "engagements": row.metrics.engagements,
+                "conversions": row.metrics.conversions,
+                "all_conversions": row.metrics.all_conversions,
+                "view_through_conversions": row.metrics.view_through_conversions,
+                "cost_micros": row.metrics.cost_micros,
+                "ctr": row.metrics.ctr,
+                "average_cpc": row.metrics.average_cpc,
+                "absolute_top_impression_percentage": row.metrics.absolute_top_impression_percentage,
+                "top_impression_percentage": row.metrics.top_impression_percentage,
+                "cost_per_conversion": row.metrics.cost_per_conversion,
+            }
+        )
+    return pd.DataFrame(all_reports)[google_dtypes.keys()]
+
+
+def measure(func, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+@app.command()
+def main(n_rows: int = 100_000, repeat: int = 3) -> None:
+    converters = {
+        "legacy": rows_to_dataframe_legacy,
+        "columnar": lambda rows: rows_to_dataframe(rows, REPORT_COLUMNS, google_dtypes),
+    }
+    for use_proto_plus in (True, False):
+        rows = make_rows(n_rows, use_proto_plus)
+        for name, func in converters.items():
+            rows_per_sec = measure(func, rows, repeat)
+            print(
+                f"{name:>8} use_proto_plus={use_proto_plus!s:<5} "
+                f"{rows_per_sec:>12,.0f} rows/sec"
+            )
+
+
+if __name__ == "__main__":
+    app()
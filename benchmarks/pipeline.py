@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from pathlib import Path
+
+import arrow
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import typer
+from google.ads.googleads.client import GoogleAdsClient
+from google_ads.google_ads import (
+    QUERY,
+    REPORT_COLUMNS,
+    create_query,
+    get_googleads_query_df,
+    get_googleads_query_table,
+    transform_report_campaign,
+    transform_report_campaign_table,
+)
+from tiktok_ads import tiktok_ads
+from utils import bq_helper
+from utils.data_lake import write_to_lake
+from utils.date_helper import get_date_windows
+from utils.fetch_options import FetchOptions
+from utils.schemas import ReportFormat, google_dtypes, google_schema, tiktok_schema
+from utils.transform_pool import TransformPool, run_transform
+
+ROOT_DIR = Path(__file__).absolute().parent.parent
+
+RESULTS_DIR = ROOT_DIR / "benchmarks/results"
+
+START_DATE = "2024-01-01"
+
+app = typer.Typer(help="Benchmark the report pipeline stages against local fakes")
+
+
+class BenchmarkSource(str, Enum):
+    google = "google"
+    tiktok = "tiktok"
+
+
+class FakeGoogleAdsService:
+    """Replays GoogleAdsService.search_stream from serialized responses.
+
+    Every (customer, day) holds one serialized SearchGoogleAdsStreamResponse,
+    a request parses the days of its query's date range, so the fetch pays
+    the protobuf decoding of a real stream.
+    """
+
+    def __init__(self, n_accounts: int, n_campaigns: int, days: list) -> None:
+        client = GoogleAdsClient(None, "benchmark", use_proto_plus=False)
+        self._response_type = type(client.get_type("SearchGoogleAdsStreamResponse"))
+        self._batches = {}
+        for account in range(n_accounts):
+            batches = self._batches.setdefault(str(1_000_000_000 + account), [])
+            for day in days:
+                response = self._response_type()
+                for campaign in range(n_campaigns):
+                    make_google_row(response.results.add(), account, campaign, day)
+                batches.append((day, response.SerializeToString()))
+
+    def search_stream(self, customer_id, query):
+        start_date, end_date = re.search(
+            r"BETWEEN '([\d-]+)' AND '([\d-]+)'", query
+        ).groups()
+        for day, data in self._batches[customer_id]:
+            if start_date <= day <= end_date:
+                yield self._response_type.FromString(data)
+
+
+def make_google_row(row, account: int, campaign: int, day: str) -> None:
+    seed = account * 7919 + campaign * 104_729 + int(day.replace("-", ""))
+    row.segments.date = day
+    row.customer.id = 1_000_000_000 + account
+    row.customer.currency_code = ("IDR", "USD", "SGD")[account % 3]
+    row.campaign.id = 10_000_000_000 + account * 1_000 + campaign
+    row.campaign.name = f"account {account} campaign {campaign}"
+    # Every tenth campaign has no impressions and is dropped by the transform
+    row.metrics.impressions = 0 if campaign % 10 == 9 else seed % 100_000 + 1
+    row.metrics.clicks = seed % 997
+    row.metrics.video_views = seed % 13
+    row.metrics.engagements = seed % 7
+    row.metrics.conversions = seed % 5 * 0.5
+    row.metrics.all_conversions = seed % 5 * 0.75
+    row.metrics.view_through_conversions = seed % 3
+    row.metrics.cost_micros = seed * 1_000
+    row.metrics.ctr = 0.01
+    row.metrics.average_cpc = 1500.0
+    row.metrics.absolute_top_impression_percentage = 0.4
+    row.metrics.top_impression_percentage = 0.6
+    row.metrics.cost_per_conversion = 2500.0
+
+
+class FakeTiktokSession:
+    """Replays TiktokSession.report_integrated_get from JSON pages.
+
+    The rows are kept JSON encoded and every page is decoded on request,
+    like the SDK parsing a response body. Date ranges, paging and the
+    page_info totals follow the reporting endpoint, so the query mode and
+    date splitting logic of get_report_rows runs as it does against the API.
+    """
+
+    def __init__(
+        self, n_accounts: int, n_campaigns: int, days: list, pool_size: int = 1
+    ) -> None:
+        self.pool_size = pool_size
+        self.page_executor = ThreadPoolExecutor(max_workers=pool_size)
+        self._rows = {
+            str(7_000_000_000 + account): [
+                (day, json.dumps(make_tiktok_row(account, campaign, day)))
+                for day in days
+                for campaign in range(n_campaigns)
+            ]
+            for account in range(n_accounts)
+        }
+
+    def report_integrated_get(self, advertiser_id, report_type, dimensions, **kwargs):
+        rows = [
+            row
+            for day, row in self._rows[str(advertiser_id)]
+            if kwargs["start_date"] <= day <= kwargs["end_date"]
+        ]
+        page, page_size = kwargs["page"], kwargs["page_size"]
+        page_info = {
+            "page": page,
+            "page_size": page_size,
+            "total_number": len(rows),
+            "total_page": math.ceil(len(rows) / page_size),
+        }
+        page_rows = ",".join(rows[(page - 1) * page_size : page * page_size])
+        return json.loads(
+            f'{{"code": 0, "message": "OK", "data": {{"list": [{page_rows}], '
+            f'"page_info": {json.dumps(page_info)}}}}}'
+        )
+
+
+def make_tiktok_row(account: int, campaign: int, day: str) -> dict:
+    seed = account * 7919 + campaign * 104_729 + int(day.replace("-", ""))
+    # The API reports every metric as a string
+    return {
+        "dimensions": {
+            "stat_time_day": f"{day} 00:00:00",
+            "campaign_id": str(10_000_000_000 + account * 1_000 + campaign),
+        },
+        "metrics": {
+            "advertiser_id": str(7_000_000_000 + account),
+            "advertiser_name": f"advertiser {account}",
+            "campaign_name": f"advertiser {account} campaign {campaign}",
+            "objective_type": ("REACH", "TRAFFIC", "VIDEO_VIEWS")[campaign % 3],
+            "reach": str(seed % 50_000),
+            "impressions": "0" if campaign % 10 == 9 else str(seed % 100_000 + 1),
+            "clicks": str(seed % 997),
+            "video_play_actions": str(seed % 13),
+            "result": str(seed % 7),
+            "checkout": str(seed % 3),
+            "spend": str(seed % 1_000_000),
+            "ctr": "0.53",
+            "cpc": "1500.00",
+            "cost_per_result": "2500.00",
+        },
+    }
+
+
+class FakeBigQueryClient:
+    """The BigQuery client calls of the dedup and write stages.
+
+    Queries return `existing_keys`, the keys the dedup stage treats as
+    already loaded, and load jobs only read the Parquet payload.
+    """
+
+    def __init__(self) -> None:
+        self.existing_keys = pa.table({})
+        self.loaded_bytes = 0
+
+    def query(self, query):
+        return FakeJob(self.existing_keys)
+
+    def load_table_from_file(self, file_obj, table_id, job_config=None):
+        self.loaded_bytes += len(file_obj.read())
+        return FakeJob(None)
+
+
+class FakeJob:
+    def __init__(self, table) -> None:
+        self._table = table
+
+    def result(self):
+        return self
+
+    def to_arrow(self):
+        return self._table
+
+
+class RssSampler:
+    """Tracks the peak resident set size while a stage runs."""
+
+    def __init__(self, interval: float = 0.002) -> None:
+        self.interval = interval
+        self.start = self.peak = get_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, get_rss())
+
+
+def get_rss() -> int:
+    # Current resident set size in bytes, the lifetime peak where /proc is
+    # not available
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_stage(name: str, func, units: list) -> tuple[list, dict]:
+    # func(unit) returns (output, rows). Units run one at a time, so the
+    # latencies and peak RSS belong to this stage alone.
+    outputs = []
+    latencies = []
+    rows = 0
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        for unit in units:
+            unit_start = time.perf_counter()
+            output, unit_rows = func(unit)
+            latencies.append(time.perf_counter() - unit_start)
+            outputs.append(output)
+            rows += unit_rows
+        elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "calls": len(units),
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed else None,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p90": float(np.percentile(latencies_ms, 90)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+            "max": float(latencies_ms.max()),
+        },
+        "start_rss_mb": rss.start / 2**20,
+        "peak_rss_mb": rss.peak / 2**20,
+    }
+    print(
+        f"{name:>10} calls={len(units):<5} rows={rows:<9} "
+        f"{result['rows_per_sec'] or 0:>12,.0f} rows/sec "
+        f"p50={result['latency_ms']['p50']:>8,.2f} ms "
+        f"p99={result['latency_ms']['p99']:>8,.2f} ms "
+        f"peak_rss={result['peak_rss_mb']:>8,.1f} MB"
+    )
+    return outputs, result
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@app.command()
+def run(
+    source: BenchmarkSource = BenchmarkSource.google,
+    n_accounts: int = 10,
+    n_campaigns: int = 50,
+    days: int = 90,
+    window_days: int = 30,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+    transform_workers: int = 0,
+    existing_fraction: float = 0.5,
+    output_dir: Path = RESULTS_DIR,
+) -> None:
+    # Fetches every (account, window) unit from the fakes, then transforms,
+    # dedups and writes them stage by stage. The dedup stage treats
+    # existing_fraction of each window's rows as already loaded.
+    start = arrow.get(START_DATE)
+    day_range = [
+        day.format("YYYY-MM-DD") for day in arrow.Arrow.range("day", start, limit=days)
+    ]
+    windows = [
+        (window_start.format("YYYY-MM-DD"), window_end.format("YYYY-MM-DD"))
+        for window_start, window_end in get_date_windows(
+            day_range[0], day_range[-1], window_days
+        )
+    ]
+    print(
+        f"Building {source.value} fixtures for {n_accounts} accounts, "
+        f"{n_campaigns} campaigns and {days} days"
+    )
+    if source == BenchmarkSource.google:
+        service = FakeGoogleAdsService(n_accounts, n_campaigns, day_range)
+        accounts = [str(1_000_000_000 + account) for account in range(n_accounts)]
+        schema = google_schema
+        composite_primary_key = ("date", "customer_id", "campaign_id")
+    else:
+        session = FakeTiktokSession(n_accounts, n_campaigns, day_range)
+        accounts = [str(7_000_000_000 + account) for account in range(n_accounts)]
+        schema = tiktok_schema
+        composite_primary_key = ("date", "advertiser_id", "campaign_id")
+    units = [(account, window) for window in windows for account in accounts]
+
+    def fetch(unit):
+        account, (window_start, window_end) = unit
+        if source == BenchmarkSource.tiktok:
+            rows = tiktok_ads.get_report_rows(
+                session, account, window_start, window_end
+            )
+            return rows, len(rows)
+        query = create_query(QUERY, arrow.get(window_start), arrow.get(window_end))
+        if report_format == ReportFormat.arrow:
+            report = get_googleads_query_table(
+                account, service, query, REPORT_COLUMNS, google_dtypes
+            )
+        else:
+            report = get_googleads_query_df(account, service, query)
+        return report, len(report)
+
+    def transform(report):
+        if source == BenchmarkSource.tiktok:
+            report = tiktok_ads.transform_report_campaign(report, {}, options=options)
+            return report, len(report)
+        # Same steps as fetch_report_campaign after the query
+        if report_format == ReportFormat.arrow:
+            report = transform_report_campaign_table(report)
+        else:
+            report = run_transform(
+                options.transform_pool, transform_report_campaign, report
+            )
+        report = options.finish_report(report)
+        return report, len(report)
+
+    bigquery_client = FakeBigQueryClient()
+    bq_helper.get_bigquery_client = lambda project_id: bigquery_client
+
+    def dedup(reports):
+        # Same steps as write_reports and the dedup load mode
+        table = pa.concat_tables(
+            [bq_helper.report_to_arrow(report, schema) for report in reports]
+        )
+        keys = table.select(list(composite_primary_key))
+        bigquery_client.existing_keys = keys.slice(
+            0, int(keys.num_rows * existing_fraction)
+        )
+        new_rows = bq_helper.check_existing_bigquery(
+            table, "benchmark", "benchmark.reports", composite_primary_key
+        )
+        return (table, new_rows), table.num_rows
+
+    def write(tables):
+        table, new_rows = tables
+        write_to_lake(table, lake_dir, composite_primary_key)
+        bq_helper.load_parquet_to_bigquery(
+            bigquery_client, new_rows, "benchmark.reports", schema
+        )
+        return None, table.num_rows
+
+    stages = {}
+    with TransformPool(transform_workers) as transform_pool:
+        options = FetchOptions(
+            transform_pool=transform_pool, report_format=report_format, compact=compact
+        )
+        reports, stages["fetch"] = run_stage("fetch", fetch, units)
+        reports, stages["transform"] = run_stage("transform", transform, reports)
+    window_reports = [
+        [
+            report
+            for (_, unit_window), report in zip(units, reports)
+            if unit_window == window and len(report)
+        ]
+        for window in windows
+    ]
+    del reports
+    tables, stages["dedup"] = run_stage("dedup", dedup, window_reports)
+    del window_reports
+    with tempfile.TemporaryDirectory() as lake_dir:
+        lake_dir = Path(lake_dir)
+        _, stages["write"] = run_stage("write", write, tables)
+
+    results = {
+        "source": source.value,
+        "timestamp": arrow.utcnow().isoformat(),
+        "git_commit": get_git_commit(),
+        "parameters": {
+            "n_accounts": n_accounts,
+            "n_campaigns": n_campaigns,
+            "days": days,
+            "window_days": window_days,
+            "report_format": report_format.value,
+            "compact": compact,
+            "transform_workers": transform_workers,
+            "existing_fraction": existing_fraction,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+            "machine": platform.machine(),
+        },
+        "stages": stages,
+    }
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / (
+        f"{source.value}-{arrow.utcnow().format('YYYYMMDDTHHmmss')}.json"
+    )
+    output_path.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output_path}")
+
+
+@app.command()
+def compare(baseline: Path, candidate: Path) -> None:
+    # Ratios of the candidate run to the baseline run for every stage, above
+    # 1 means more throughput and below 1 lower latency and memory
+    baseline_results = json.loads(baseline.read_text())
+    candidate_results = json.loads(candidate.read_text())
+    if baseline_results["parameters"] != candidate_results["parameters"]:
+        print("Warning: the runs were made with different parameters")
+    for name, before in baseline_results["stages"].items():
+        after = candidate_results["stages"].get(name)
+        if after is None:
+            continue
+        print(
+            f"{name:>10} "
+            f"throughput {after['rows_per_sec'] / before['rows_per_sec']:>6.2f}x "
+            f"p50 {after['latency_ms']['p50'] / before['latency_ms']['p50']:>6.2f}x "
+            f"p99 {after['latency_ms']['p99'] / before['latency_ms']['p99']:>6.2f}x "
+            f"peak_rss {after['peak_rss_mb'] - before['peak_rss_mb']:>+8,.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+import arrow
+import db_dtypes  # noqa: F401  registers the dbdate dtype the reports use
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import typer
+from utils.bq_helper import dataframe_to_arrow, report_to_arrow
+from utils.schemas import (
+    compact_report,
+    compact_report_table,
+    google_conversion_dtypes,
+    google_conversion_schema,
+    google_dtypes,
+    google_schema,
+    tiktok_dtypes,
+    tiktok_schema,
+)
+
+app = typer.Typer(help="Benchmark the memory of the report representations")
+
+REPORTS = {
+    "google": (google_dtypes, google_schema),
+    "google_conversion": (google_conversion_dtypes, google_conversion_schema),
+    "tiktok": (tiktok_dtypes, tiktok_schema),
+}
+
+# Columns with one value per account, the others vary per campaign
+ACCOUNT_COLUMNS = {"customer_id", "advertiser_id", "advertiser_name", "currency_code"}
+
+CATEGORY_VALUES = {
+    "currency_code": ["IDR", "USD", "SGD"],
+    "objective_type": ["REACH", "TRAFFIC", "VIDEO_VIEWS", "CONVERSIONS"],
+    "conversion_action_name": ["Purchase", "Add to cart", "Sign up", "Page view"],
+    "conversion_action_category": ["PURCHASE", "ADD_TO_CART", "SIGNUP", "UNKNOWN"],
+}
+
+
+def make_window(dtypes, account, n_campaigns, dates, rng) -> pd.DataFrame:
+    # One account's report for one window, with the dtypes the fetchers emit
+    n_rows = n_campaigns * len(dates)
+    campaigns = np.tile(np.arange(n_campaigns), len(dates))
+    columns = {}
+    for name, dtype in dtypes.items():
+        if name == "date":
+            columns[name] = pd.Series(np.repeat(dates, n_campaigns)).astype(dtype)
+        elif name in CATEGORY_VALUES:
+            values = CATEGORY_VALUES[name]
+            if name in ACCOUNT_COLUMNS:
+                columns[name] = [values[account % len(values)]] * n_rows
+            else:
+                columns[name] = [
+                    values[campaign % len(values)] for campaign in campaigns
+                ]
+        elif name in ACCOUNT_COLUMNS:
+            if name.endswith("_id"):
+                columns[name] = [str(1_000_000_000 + account)] * n_rows
+            else:
+                columns[name] = [f"account {account}"] * n_rows
+        elif dtype is str:
+            # New string objects per row, like the values the APIs return
+            columns[name] = [
+                f"{10_000_000_000 + account * 1_000 + campaign}"
+                if name.endswith("_id") or name == "conversion_action"
+                else f"{name} {account} {campaign}"
+                for campaign in campaigns
+            ]
+        elif dtype is int:
+            columns[name] = rng.integers(0, 100_000, n_rows)
+        else:
+            columns[name] = rng.random(n_rows)
+    return pd.DataFrame(columns)
+
+
+def make_reports(dtypes, n_accounts, n_campaigns, days, window_days):
+    rng = np.random.default_rng(0)
+    start = arrow.get("2024-01-01")
+    dates = [day.date() for day in arrow.Arrow.range("day", start, limit=days)]
+    windows = [dates[i : i + window_days] for i in range(0, days, window_days)]
+    return [
+        make_window(dtypes, account, n_campaigns, window, rng)
+        for account in range(n_accounts)
+        for window in windows
+    ]
+
+
+def held_bytes(reports) -> int:
+    return sum(
+        report.nbytes
+        if isinstance(report, pa.Table)
+        else int(report.memory_usage(deep=True).sum())
+        for report in reports
+    )
+
+
+@app.command()
+def main(
+    n_accounts: int = 20,
+    n_campaigns: int = 40,
+    days: int = 365,
+    window_days: int = 30,
+) -> None:
+    for report_name, (dtypes, schema) in REPORTS.items():
+        reports = make_reports(dtypes, n_accounts, n_campaigns, days, window_days)
+        n_rows = sum(len(report) for report in reports)
+        tables = [dataframe_to_arrow(report, schema) for report in reports]
+        representations = {
+            "pandas": reports,
+            "pandas compact": [compact_report(report) for report in reports],
+            "arrow": tables,
+            "arrow compact": [compact_report_table(table) for table in tables],
+        }
+        baseline = held_bytes(reports)
+        for name, held in representations.items():
+            # The per report conversion and concat of write_reports
+            start = time.perf_counter()
+            pa.concat_tables([report_to_arrow(report, schema) for report in held])
+            elapsed = time.perf_counter() - start
+            size = held_bytes(held)
+            print(
+                f"{report_name:>17} {name:>14} rows={n_rows} "
+                f"{size / 2**20:>9,.1f} MB {baseline / size:>5.1f}x "
+                f"write {elapsed * 1000:>8,.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    app()
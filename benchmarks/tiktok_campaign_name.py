@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+import pandas as pd
+import typer
+from tiktok_ads.tiktok_ads import fix_campaign_names, get_campaign_name_index
+
+app = typer.Typer(help="Benchmark TikTok campaign name standardization")
+
+
+def make_frames(n_rows: int, n_lookup: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(0)
+    # Half of the reported campaigns have a standard name in the lookup table
+    campaign_ids = rng.integers(0, n_lookup * 2, n_rows).astype(str)
+    report_df = pd.DataFrame(
+        {
+            "campaign_id": campaign_ids,
+            "campaign_name": [f"reported {i}" for i in campaign_ids],
+        }
+    )
+    lookup_df = pd.DataFrame(
+        {
+            "campaign_id": np.arange(n_lookup).astype(str),
+            "standard_campaign_name": [f"standard {i}" for i in range(n_lookup)],
+        }
+    )
+    return report_df, lookup_df
+
+
+def fix_campaign_name_legacy(lookup_df, campaign_id):
+    # The per-row lookup that get_campaign_name_index replaced
+    campaign_names = lookup_df[lookup_df["campaign_id"] == campaign_id]
+    if campaign_names.empty:
+        return None
+    return campaign_names["standard_campaign_name"].iloc[0]
+
+
+def fix_campaign_names_legacy(report_df, lookup_df) -> pd.Series:
+    standard_campaign_name = report_df["campaign_id"].apply(
+        lambda x: fix_campaign_name_legacy(lookup_df, x)
+    )
+    return pd.Series(
+        np.where(
+            pd.isna(standard_campaign_name),
+            report_df["campaign_name"],
+            standard_campaign_name,
+        )
+    )
+
+
+def fix_campaign_names_indexed(report_df, lookup_df) -> pd.Series:
+    # Includes building the index, which a run only pays once
+    return fix_campaign_names(report_df, get_campaign_name_index(lookup_df))
+
+
+@app.command()
+def main(n_rows: int = 5_000, n_lookup: int = 5_000) -> None:
+    report_df, lookup_df = make_frames(n_rows, n_lookup)
+    results = {}
+    for name, func in (
+        ("legacy", fix_campaign_names_legacy),
+        ("indexed", fix_campaign_names_indexed),
+    ):
+        start = time.perf_counter()
+        results[name] = func(report_df, lookup_df)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>8} rows={n_rows} lookup={n_lookup} "
+            f"{elapsed * 1000:>10,.1f} ms {n_rows / elapsed:>14,.0f} rows/sec"
+        )
+    assert (results["legacy"].values == results["indexed"].values).all()
+
+
+if __name__ == "__main__":
+    app()
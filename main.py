@@ -4,10 +4,16 @@
 import google_ads.main
 import tiktok_ads.main
 import typer
+import utils.backfill
+import utils.cache
+import utils.data_lake
 
 app = typer.Typer()
 app.add_typer(google_ads.main.app, name="google")
 app.add_typer(tiktok_ads.main.app, name="tiktok")
+app.add_typer(utils.cache.app, name="cache")
+app.add_typer(utils.data_lake.app, name="lake")
+app.add_typer(utils.backfill.app, name="backfill")
 
 if __name__ == "__main__":
     app()
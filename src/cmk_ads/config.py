@@ -41,7 +41,14 @@ class Config:
     GOOGLE_ADS_LOGIN_CUSTOMER_ID: str | None = os.getenv(
         "GOOGLE_ADS_LOGIN_CUSTOMER_ID", None
     )
+    GOOGLE_ADS_HIERARCHY_REFRESH_HOURS: float = float(
+        os.getenv("GOOGLE_ADS_HIERARCHY_REFRESH_HOURS", 24)
+    )
+    LOOKUP_CACHE_TTL_HOURS: float = float(os.getenv("LOOKUP_CACHE_TTL_HOURS", 24))
     TIKTOK_AUTH_CODE: str | None = os.getenv("TIKTOK_AUTH_CODE", None)
     TIKTOK_APP_ID: str | None = os.getenv("TIKTOK_APP_ID", None)
     TIKTOK_SECRET: str | None = os.getenv("TIKTOK_SECRET", None)
     TIKTOK_ACCESS_TOKEN: str | None = os.getenv("TIKTOK_ACCESS_TOKEN", None)
+    TIKTOK_ADVERTISERS_REFRESH_HOURS: float = float(
+        os.getenv("TIKTOK_ADVERTISERS_REFRESH_HOURS", 24)
+    )
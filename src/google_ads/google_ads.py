@@ -3,13 +3,13 @@
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import arrow
 import db_dtypes
-import numpy as np
 import pandas as pd
-import pandas_gbq
+import pyarrow as pa
+import pyarrow.compute as pc
 import typer
 from cmk_ads.config import Config
 from dotenv import load_dotenv
@@ -17,17 +17,32 @@ from google.ads.googleads.client import GoogleAdsClient
 from google.ads.googleads.errors import GoogleAdsException
 from icecream import ic
 from loguru import logger
-from utils.bq_helper import (
-    export_to_parquet,
-    load_data_to_bigquery,
+from utils.arrow_helper import cast_to_schema, map_column, replace_column
+from utils.backfill import BackfillLedger, run_backfill
+from utils.bq_helper import LoadMode, load_lake_to_bigquery, write_reports
+from utils.cache import read_lookup_table
+from utils.data_lake import LAKE_TABLES, ReportSource
+from utils.date_helper import check_date_range, get_date_windows
+from utils.fetch_options import FetchOptions
+from utils.google_ads_helper import (
+    call_with_quota_retry,
+    get_account_hierarchy,
+    iter_search_batches,
+    rows_to_dataframe,
+    rows_to_table,
 )
-from utils.google_ads_helper import get_clients, get_managers
+from utils.rate_limiter import TokenBucket
 from utils.schemas import (
+    ReportFormat,
+    google_arrow_schema,
+    google_conversion_arrow_schema,
     google_conversion_dtypes,
     google_conversion_schema,
     google_dtypes,
     google_schema,
 )
+from utils.stream_writer import StreamWriter
+from utils.transform_pool import TransformPool, run_transform
 
 load_dotenv()
 
@@ -84,6 +99,48 @@ QUERY_CONVERSION = """
 """
 
 
+# Name given to conversion action categories missing from the lookup table
+UNKNOWN_CATEGORY_NAME = "UNKNOWN"
+
+# Default request budget of the backfill, shared by all workers
+BACKFILL_QPS = 10
+
+# Report columns mapped to their GoogleAdsRow field paths
+REPORT_COLUMNS = {
+    "date": "segments.date",
+    "customer_id": "customer.id",
+    "campaign_id": "campaign.id",
+    "campaign_name": "campaign.name",
+    "currency_code": "customer.currency_code",
+    "impressions": "metrics.impressions",
+    "clicks": "metrics.clicks",
+    "video_views": "metrics.video_views",
+    "engagements": "metrics.engagements",
+    "conversions": "metrics.conversions",
+    "all_conversions": "metrics.all_conversions",
+    "view_through_conversions": "metrics.view_through_conversions",
+    "cost_micros": "metrics.cost_micros",
+    "ctr": "metrics.ctr",
+    "average_cpc": "metrics.average_cpc",
+    "absolute_top_impression_percentage": "metrics.absolute_top_impression_percentage",
+    "top_impression_percentage": "metrics.top_impression_percentage",
+    "cost_per_conversion": "metrics.cost_per_conversion",
+}
+
+CONVERSION_COLUMNS = {
+    "date": "segments.date",
+    "customer_id": "customer.id",
+    "campaign_id": "campaign.id",
+    "campaign_name": "campaign.name",
+    "conversion_action": "segments.conversion_action",
+    "conversion_action_name": "segments.conversion_action_name",
+    "conversion_action_category": "segments.conversion_action_category",
+    "conversions": "metrics.conversions",
+    "all_conversions": "metrics.all_conversions",
+    "view_through_conversions": "metrics.view_through_conversions",
+}
+
+
 def create_query(query, start_date, end_date):
     return query.format(
         start_date=start_date.format("YYYY-MM-DD"),
@@ -91,157 +148,501 @@ def create_query(query, start_date, end_date):
     )
 
 
-def get_category_name(lookup_df, category_enum):
-    return lookup_df[lookup_df["id"] == category_enum]["category_name"].iloc[0]
-
-
-def get_googleads_query_df(client_id, googleads_service, query) -> pd.DataFrame:
-    response = googleads_service.search(customer_id=client_id, query=query)
-    all_reports = []
-    for row in response:
-        all_reports.append(
-            {
-                "date": row.segments.date,
-                "customer_id": row.customer.id,
-                "campaign_id": row.campaign.id,
-                "campaign_name": row.campaign.name,
-                "currency_code": row.customer.currency_code,
-                "impressions": row.metrics.impressions,
-                "clicks": row.metrics.clicks,
-                "video_views": row.metrics.video_views,
-                "engagements": row.metrics.engagements,
-                "conversions": row.metrics.conversions,
-                "all_conversions": row.metrics.all_conversions,
-                "view_through_conversions": row.metrics.view_through_conversions,
-                "cost_micros": row.metrics.cost_micros,
-                "ctr": row.metrics.ctr,
-                "average_cpc": row.metrics.average_cpc,
-                "absolute_top_impression_percentage": row.metrics.absolute_top_impression_percentage,
-                "top_impression_percentage": row.metrics.top_impression_percentage,
-                "cost_per_conversion": row.metrics.cost_per_conversion,
-            }
+def get_category_index(lookup_df: pd.DataFrame) -> dict:
+    # Maps each conversion action category enum value to its name, the first
+    # entry wins when an id appears more than once.
+    lookup_df = lookup_df.drop_duplicates("id", keep="first")
+    return dict(zip(lookup_df["id"].astype(int), lookup_df["category_name"]))
+
+
+def get_googleads_query_df(
+    client_id, googleads_service, query, search_stream=True
+) -> pd.DataFrame:
+    # Each batch is converted to a columnar chunk as soon as it arrives so the
+    # protobuf rows can be released before the next batch is read.
+    chunks = [
+        rows_to_dataframe(rows, REPORT_COLUMNS, google_dtypes)
+        for rows in iter_search_batches(
+            googleads_service, client_id, query, search_stream
         )
-    if not all_reports:
+    ]
+    chunks = [chunk for chunk in chunks if not chunk.empty]
+    if not chunks:
         return pd.DataFrame()
-    all_reports = pd.DataFrame(all_reports)
-    return all_reports[google_dtypes.keys()]
+    return pd.concat(chunks, axis=0, ignore_index=True)
 
 
 def get_googleads_query_conversion_df(
-    client_id, googleads_service, google_category_lookup, query_conversion
+    client_id,
+    googleads_service,
+    query_conversion,
+    search_stream=True,
 ) -> pd.DataFrame:
-    response = googleads_service.search(customer_id=client_id, query=query_conversion)
-    all_reports_conversion = []
-    for row in response:
-        all_reports_conversion.append(
-            {
-                "date": row.segments.date,
-                "customer_id": row.customer.id,
-                "campaign_id": row.campaign.id,
-                "campaign_name": row.campaign.name,
-                "conversion_action": row.segments.conversion_action,
-                "conversion_action_name": row.segments.conversion_action_name,
-                "conversion_action_category": row.segments.conversion_action_category,
-                "conversions": row.metrics.conversions,
-                "all_conversions": row.metrics.all_conversions,
-                "view_through_conversions": row.metrics.view_through_conversions,
-            }
+    chunks = [
+        rows_to_dataframe(rows, CONVERSION_COLUMNS, google_conversion_dtypes)
+        for rows in iter_search_batches(
+            googleads_service, client_id, query_conversion, search_stream
         )
-    if not all_reports_conversion:
+    ]
+    chunks = [chunk for chunk in chunks if not chunk.empty]
+    if not chunks:
         return pd.DataFrame()
-    all_reports_conversion = pd.DataFrame(all_reports_conversion)
-    all_reports_conversion["conversion_action_category"] = all_reports_conversion[
-        "conversion_action_category"
-    ].apply(lambda x: get_category_name(google_category_lookup, x))
-    return all_reports_conversion[google_conversion_dtypes.keys()]
+    return pd.concat(chunks, axis=0, ignore_index=True)
+
+
+def get_googleads_query_table(
+    client_id, googleads_service, query, columns, dtypes, search_stream=True
+) -> pa.Table:
+    # Arrow version of the query frames, every batch becomes a table and the
+    # tables are concatenated without copying their columns.
+    chunks = [
+        rows_to_table(rows, columns, dtypes)
+        for rows in iter_search_batches(
+            googleads_service, client_id, query, search_stream
+        )
+    ]
+    chunks = [chunk for chunk in chunks if chunk.num_rows]
+    if not chunks:
+        return pa.table({})
+    return pa.concat_tables(chunks)
 
 
-def get_report_campaign(
+def transform_report_campaign(report_df: pd.DataFrame) -> pd.DataFrame:
+    report_df["date"] = pd.to_datetime(report_df["date"])
+    report_df["date"] = report_df["date"].astype("dbdate")
+    report_df[["customer_id", "campaign_id"]] = report_df[
+        ["customer_id", "campaign_id"]
+    ].astype(str)
+    report_df = report_df[report_df["impressions"] > 0].reset_index(drop=True)
+    return report_df
+
+
+def transform_report_campaign_conversion(
+    report_conversion_df: pd.DataFrame, google_category_index: dict
+) -> pd.DataFrame:
+    report_conversion_df["conversion_action_category"] = (
+        report_conversion_df["conversion_action_category"]
+        .map(google_category_index)
+        .fillna(UNKNOWN_CATEGORY_NAME)
+    )
+    report_conversion_df["date"] = pd.to_datetime(report_conversion_df["date"])
+    report_conversion_df["date"] = report_conversion_df["date"].astype("dbdate")
+    report_conversion_df[["customer_id", "campaign_id"]] = report_conversion_df[
+        ["customer_id", "campaign_id"]
+    ].astype(str)
+    return report_conversion_df
+
+
+def transform_report_campaign_table(report_table: pa.Table) -> pa.Table:
+    # Arrow version of transform_report_campaign, the schema cast parses the
+    # dates and turns the ids into strings.
+    report_table = report_table.filter(pc.greater(report_table["impressions"], 0))
+    return cast_to_schema(report_table, google_arrow_schema)
+
+
+def transform_report_campaign_conversion_table(
+    report_conversion_table: pa.Table, google_category_index: dict
+) -> pa.Table:
+    categories = map_column(
+        report_conversion_table["conversion_action_category"], google_category_index
+    )
+    report_conversion_table = replace_column(
+        report_conversion_table,
+        "conversion_action_category",
+        pc.fill_null(categories, UNKNOWN_CATEGORY_NAME),
+    )
+    return cast_to_schema(report_conversion_table, google_conversion_arrow_schema)
+
+
+def fetch_report_campaign(
     client_id: str,
     googleads_service: GoogleAdsClient,
     query: str,
     start_date: str,
     end_date: str,
-) -> pd.DataFrame:
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
+    # Raises the GoogleAdsException of a failed query
     query = create_query(query, start_date, end_date)
+    if options.report_format == ReportFormat.arrow:
+        report_table = call_with_quota_retry(
+            get_googleads_query_table,
+            client_id,
+            googleads_service,
+            query,
+            REPORT_COLUMNS,
+            google_dtypes,
+            options.search_stream,
+        )
+        if not report_table.num_rows:
+            return report_table
+        return options.finish_report(transform_report_campaign_table(report_table))
+    report_df = call_with_quota_retry(
+        get_googleads_query_df,
+        client_id,
+        googleads_service,
+        query,
+        options.search_stream,
+    )
+    if report_df.empty:
+        return pd.DataFrame()
+    report_df = run_transform(
+        options.transform_pool, transform_report_campaign, report_df
+    )
+    return options.finish_report(report_df)
+
+
+def get_report_campaign(
+    client_id: str,
+    googleads_service: GoogleAdsClient,
+    query: str,
+    start_date: str,
+    end_date: str,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
     try:
-        report_df = get_googleads_query_df(
+        return fetch_report_campaign(
             client_id,
             googleads_service,
             query,
+            start_date,
+            end_date,
+            options=options,
         )
     except GoogleAdsException as e:
         logger.error(f"Exception when calling GoogleAds API: {e}")
         return pd.DataFrame()
-    if report_df.empty:
+
+
+def fetch_report_campaign_conversion(
+    client_id: str,
+    googleads_service: GoogleAdsClient,
+    google_category_index: dict,
+    query_conversion: str,
+    start_date: str,
+    end_date: str,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
+    # Raises the GoogleAdsException of a failed query
+    query_conversion = create_query(query_conversion, start_date, end_date)
+    if options.report_format == ReportFormat.arrow:
+        report_conversion_table = call_with_quota_retry(
+            get_googleads_query_table,
+            client_id,
+            googleads_service,
+            query_conversion,
+            CONVERSION_COLUMNS,
+            google_conversion_dtypes,
+            options.search_stream,
+        )
+        if not report_conversion_table.num_rows:
+            return report_conversion_table
+        report_conversion_table = transform_report_campaign_conversion_table(
+            report_conversion_table, google_category_index
+        )
+        return options.finish_report(report_conversion_table)
+    report_conversion_df = call_with_quota_retry(
+        get_googleads_query_conversion_df,
+        client_id,
+        googleads_service,
+        query_conversion,
+        options.search_stream,
+    )
+    if report_conversion_df.empty:
         return pd.DataFrame()
-    report_df["date"] = pd.to_datetime(report_df["date"])
-    report_df["date"] = report_df["date"].astype("dbdate")
-    report_df[["customer_id", "campaign_id"]] = report_df[
-        ["customer_id", "campaign_id"]
-    ].astype(str)
-    report_df = report_df[report_df["impressions"] > 0].reset_index(drop=True)
-    return report_df
+    report_conversion_df = run_transform(
+        options.transform_pool,
+        transform_report_campaign_conversion,
+        report_conversion_df,
+        google_category_index,
+    )
+    return options.finish_report(report_conversion_df)
 
 
 def get_report_campaign_conversion(
     client_id: str,
     googleads_service: GoogleAdsClient,
-    google_category_lookup: pd.DataFrame,
+    google_category_index: dict,
     query_conversion: str,
     start_date: str,
     end_date: str,
-) -> pd.DataFrame:
-    query_conversion = create_query(query_conversion, start_date, end_date)
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
     try:
-        report_conversion_df = get_googleads_query_conversion_df(
+        return fetch_report_campaign_conversion(
             client_id,
             googleads_service,
-            google_category_lookup,
+            google_category_index,
             query_conversion,
+            start_date,
+            end_date,
+            options=options,
         )
     except GoogleAdsException as e:
         logger.error(f"Exception when calling GoogleAds API: {e}")
         return pd.DataFrame()
-    if report_conversion_df.empty:
-        return pd.DataFrame()
-    report_conversion_df["date"] = pd.to_datetime(report_conversion_df["date"])
-    report_conversion_df["date"] = report_conversion_df["date"].astype("dbdate")
-    report_conversion_df[["customer_id", "campaign_id"]] = report_conversion_df[
-        ["customer_id", "campaign_id"]
-    ].astype(str)
-    return report_conversion_df
 
 
-@app.command()
-def get_report(
-    date: str,
-    export: bool = False,
+def get_client_reports(
+    client_id: str,
+    googleads_service: GoogleAdsClient,
+    google_category_index: dict,
+    start_date: str,
+    end_date: str,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> tuple[pd.DataFrame | pa.Table, pd.DataFrame | pa.Table]:
+    df_report = get_report_campaign(
+        client_id,
+        googleads_service,
+        QUERY,
+        start_date,
+        end_date,
+        options=options,
+    )
+    df_report_conversion = get_report_campaign_conversion(
+        client_id,
+        googleads_service,
+        google_category_index,
+        QUERY_CONVERSION,
+        start_date,
+        end_date,
+        options=options,
+    )
+    return df_report, df_report_conversion
+
+
+def get_reports(
+    clients: pd.DataFrame,
+    googleads_service: GoogleAdsClient,
+    google_category_index: dict,
+    start_date: str,
+    end_date: str,
+    concurrency: int = 1,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> tuple[list, list]:
+    campaign_reports = []
+    conversion_reports = []
+    # The service clients are thread-safe, so the clients can share them.
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = [
+            (
+                client_id,
+                executor.submit(
+                    get_client_reports,
+                    client_id,
+                    googleads_service,
+                    google_category_index,
+                    start_date,
+                    end_date,
+                    options=options,
+                ),
+            )
+            for client_id in clients["client_id"]
+        ]
+        # Reports are gathered in client order, not in completion order
+        for client_id, future in futures:
+            try:
+                df_report, df_report_conversion = future.result()
+            except Exception as e:
+                logger.error(f"Failed to get reports for client {client_id}: {e}")
+                continue
+            if len(df_report):
+                campaign_reports.append(df_report)
+            if len(df_report_conversion):
+                conversion_reports.append(df_report_conversion)
+    return campaign_reports, conversion_reports
+
+
+def collect_reports(kind: str, futures) -> list[pd.DataFrame | pa.Table]:
+    # Futures are consumed in submission order to keep the output deterministic.
+    reports = []
+    for client_id, future in futures:
+        try:
+            df = future.result()
+        except Exception as e:
+            logger.error(f"Failed to get {kind} report for client {client_id}: {e}")
+            continue
+        if len(df):
+            reports.append(df)
+    return reports
+
+
+def run_report_pipeline(
+    clients: pd.DataFrame,
+    googleads_service: GoogleAdsClient,
+    google_category_index: dict,
+    start_date: str,
+    end_date: str,
+    campaign_writer: dict,
+    conversion_writer: dict,
+    concurrency: int = 1,
     dry_run: bool = False,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> None:
+    # Every campaign and conversion query is its own task on one shared
+    # executor, so neither report waits for the other per client. Each report
+    # type has a writer task that collects its futures and exports and loads
+    # them as soon as its last query finishes, so the two loads overlap with
+    # each other and with whatever queries are still running.
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    writer = ThreadPoolExecutor(max_workers=2)
+    with executor, writer:
+        campaign_futures = [
+            (
+                client_id,
+                executor.submit(
+                    get_report_campaign,
+                    client_id,
+                    googleads_service,
+                    QUERY,
+                    start_date,
+                    end_date,
+                    options=options,
+                ),
+            )
+            for client_id in clients["client_id"]
+        ]
+        conversion_futures = [
+            (
+                client_id,
+                executor.submit(
+                    get_report_campaign_conversion,
+                    client_id,
+                    googleads_service,
+                    google_category_index,
+                    QUERY_CONVERSION,
+                    start_date,
+                    end_date,
+                    options=options,
+                ),
+            )
+            for client_id in clients["client_id"]
+        ]
+
+        def collect_and_write(kind, futures, writer_kwargs) -> None:
+            reports = collect_reports(kind, futures)
+            if dry_run:
+                logger.info(f"Dry running. Not writing {kind} reports")
+                return
+            write_reports(reports, kind, **writer_kwargs)
+
+        writes = [
+            writer.submit(
+                collect_and_write, "campaign", campaign_futures, campaign_writer
+            ),
+            writer.submit(
+                collect_and_write, "conversion", conversion_futures, conversion_writer
+            ),
+        ]
+        for write in writes:
+            write.result()
+
+
+def stream_reports(
+    clients: pd.DataFrame,
+    googleads_service: GoogleAdsClient,
+    google_category_index: dict,
+    start_date: str,
+    end_date: str,
+    campaign_writer: StreamWriter,
+    conversion_writer: StreamWriter,
+    concurrency: int = 1,
+    *,
+    options: FetchOptions = FetchOptions(),
 ) -> None:
+    # Each task hands its frame to the writer as soon as it is fetched, the
+    # bounded writer queues hold back the workers when loading falls behind.
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for client_id in clients["client_id"]:
+            executor.submit(
+                campaign_writer.fetch_into,
+                f"campaign report for client {client_id}",
+                get_report_campaign,
+                client_id,
+                googleads_service,
+                QUERY,
+                start_date,
+                end_date,
+                options=options,
+            )
+            executor.submit(
+                conversion_writer.fetch_into,
+                f"conversion report for client {client_id}",
+                get_report_campaign_conversion,
+                client_id,
+                googleads_service,
+                google_category_index,
+                QUERY_CONVERSION,
+                start_date,
+                end_date,
+                options=options,
+            )
+
+
+def get_report_writers(
+    export: bool = False, load_mode: LoadMode = LoadMode.dedup
+) -> tuple[dict, dict]:
+    # Destination of the campaign and conversion reports, as the keyword
+    # arguments of write_reports and StreamWriter
     bq_project_id = Config().BIGQUERY_PROJECT_ID
     bq_dataset_id = Config().BIGQUERY_DATASET_ID
     bq_table_id = Config().BIGQUERY_TABLE_GOOGLE_STAGING_ID
     bq_table_id = f"{bq_project_id}.{bq_dataset_id}.{bq_table_id}"
     bq_table_conversion_id = Config().BIGQUERY_TABLE_GOOGLE_CONVERSION_STAGING_ID
     bq_table_conversion_id = f"{bq_project_id}.{bq_dataset_id}.{bq_table_conversion_id}"
-    bq_category_lookup_id = Config().BIGQUERY_TABLE_GOOGLE_CATEGORY_LOOKUP_ID
-    bq_category_lookup_id = f"{bq_project_id}.{bq_dataset_id}.{bq_category_lookup_id}"
 
-    google_category_lookup = pandas_gbq.read_gbq(bq_category_lookup_id, bq_project_id)
-    if google_category_lookup is None:
-        return
+    campaign_writer = dict(
+        export_dir=LAKE_TABLES["google"],
+        bq_project_id=bq_project_id,
+        bq_table_id=bq_table_id,
+        schema=google_schema,
+        composite_primary_key=("date", "customer_id", "campaign_id"),
+        export=export,
+        load_mode=load_mode,
+    )
+    conversion_writer = dict(
+        export_dir=LAKE_TABLES["google_conversion"],
+        bq_project_id=bq_project_id,
+        bq_table_id=bq_table_conversion_id,
+        schema=google_conversion_schema,
+        composite_primary_key=(
+            "date",
+            "customer_id",
+            "campaign_id",
+            "conversion_action",
+        ),
+        export=export,
+        load_mode=load_mode,
+    )
+    return campaign_writer, conversion_writer
 
-    start_date = arrow.get(date, tzinfo="local").floor("day")
-    end_date = start_date.ceil("day")
-    year = start_date.format("YYYY")
-    month = start_date.format("MM")
-    day = start_date.format("DD")
 
-    # prepare log file
-    logger.add(ROOT_DIR / "log/google_ads/report_{time}.log")
+def get_report_services(
+    concurrency: int = 1, refresh_lookup: bool = False, refresh_accounts: bool = False
+) -> tuple[GoogleAdsClient, dict, pd.DataFrame] | None:
+    # Returns the GoogleAdsService, the category index and the client accounts,
+    # or None when the lookup table or the accounts are unavailable.
+    bq_project_id = Config().BIGQUERY_PROJECT_ID
+    bq_dataset_id = Config().BIGQUERY_DATASET_ID
+    bq_category_lookup_id = Config().BIGQUERY_TABLE_GOOGLE_CATEGORY_LOOKUP_ID
+    bq_category_lookup_id = f"{bq_project_id}.{bq_dataset_id}.{bq_category_lookup_id}"
 
-    logger.info(f"Getting Google Report for {start_date.format('YYYY-MM-DD')}")
+    google_category_lookup = read_lookup_table(
+        bq_category_lookup_id,
+        bq_project_id,
+        Config().LOOKUP_CACHE_TTL_HOURS,
+        refresh_lookup,
+    )
+    if google_category_lookup is None:
+        return None
+    google_category_index = get_category_index(google_category_lookup)
 
     # Initialize a GoogleAdsClient instance
     client = GoogleAdsClient.load_from_env()
@@ -250,74 +651,318 @@ def get_report(
     googleads_service = client.get_service("GoogleAdsService")
     customer_service = client.get_service("CustomerService")
 
-    manager_ids = get_managers(googleads_service, customer_service)
-    clients = get_clients(googleads_service, manager_ids)
+    clients = get_account_hierarchy(
+        googleads_service,
+        customer_service,
+        client.login_customer_id,
+        Config().GOOGLE_ADS_HIERARCHY_REFRESH_HOURS,
+        refresh_accounts,
+        concurrency,
+    )
     if clients.empty:
         logger.error("No clients found.")
+        return None
+    return googleads_service, google_category_index, clients
+
+
+@app.command()
+def get_report(
+    date: str,
+    export: bool = False,
+    dry_run: bool = False,
+    concurrency: int = 1,
+    search_stream: bool = True,
+    load_mode: LoadMode = LoadMode.dedup,
+    refresh_lookup: bool = False,
+    refresh_accounts: bool = False,
+    pipeline: bool = False,
+    stream: bool = False,
+    batch_rows: int = 50_000,
+    source: ReportSource = ReportSource.api,
+    transform_workers: int = 0,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+) -> None:
+    get_report_range(
+        date,
+        date,
+        export=export,
+        dry_run=dry_run,
+        concurrency=concurrency,
+        search_stream=search_stream,
+        load_mode=load_mode,
+        refresh_lookup=refresh_lookup,
+        refresh_accounts=refresh_accounts,
+        pipeline=pipeline,
+        stream=stream,
+        batch_rows=batch_rows,
+        source=source,
+        transform_workers=transform_workers,
+        report_format=report_format,
+        compact=compact,
+    )
+
+
+@app.command()
+def get_report_range(
+    start_date: str,
+    end_date: str,
+    window_days: int = 30,
+    export: bool = False,
+    dry_run: bool = False,
+    concurrency: int = 1,
+    search_stream: bool = True,
+    load_mode: LoadMode = LoadMode.dedup,
+    refresh_lookup: bool = False,
+    refresh_accounts: bool = False,
+    pipeline: bool = False,
+    stream: bool = False,
+    batch_rows: int = 50_000,
+    source: ReportSource = ReportSource.api,
+    transform_workers: int = 0,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+) -> None:
+    check_date_range(start_date, end_date)
+    if pipeline and stream:
+        raise typer.BadParameter("--pipeline and --stream cannot be combined")
+    campaign_writer, conversion_writer = get_report_writers(export, load_mode)
+
+    # prepare log file
+    logger.add(ROOT_DIR / "log/google_ads/report_{time}.log")
+
+    if source == ReportSource.lake:
+        # The lake holds transformed reports, so neither the lookup table nor
+        # the account hierarchy is needed.
+        for window_start, window_end in get_date_windows(
+            start_date, end_date, window_days
+        ):
+            window_start = window_start.format("YYYY-MM-DD")
+            window_end = window_end.format("YYYY-MM-DD")
+            logger.info(
+                f"Loading Google Report for {window_start} to {window_end} "
+                "from the data lake"
+            )
+            load_lake_to_bigquery(
+                "campaign",
+                window_start,
+                window_end,
+                **campaign_writer,
+                dry_run=dry_run,
+            )
+            load_lake_to_bigquery(
+                "conversion",
+                window_start,
+                window_end,
+                **conversion_writer,
+                dry_run=dry_run,
+            )
         return
 
-    campaign_reports = []
-    conversion_reports = []
-    for client_id in clients["client_id"]:
-        df_report = get_report_campaign(
+    services = get_report_services(concurrency, refresh_lookup, refresh_accounts)
+    if services is None:
+        return
+    googleads_service, google_category_index, clients = services
+
+    with TransformPool(transform_workers) as transform_pool:
+        options = FetchOptions(
+            search_stream=search_stream,
+            transform_pool=transform_pool,
+            report_format=report_format,
+            compact=compact,
+        )
+        # The account hierarchy and lookup table are shared by every window,
+        # each window costs one query per client and report type.
+        for window_start, window_end in get_date_windows(
+            start_date, end_date, window_days
+        ):
+            window_start = window_start.format("YYYY-MM-DD")
+            window_end = window_end.format("YYYY-MM-DD")
+            logger.info(f"Getting Google Report for {window_start} to {window_end}")
+            logger.info(
+                f"Fetching reports for {len(clients)} clients "
+                f"with concurrency {concurrency}"
+            )
+
+            if stream:
+                stream_options = dict(
+                    batch_rows=batch_rows, queue_size=concurrency, dry_run=dry_run
+                )
+                campaign_stream = StreamWriter(
+                    "campaign", **campaign_writer, **stream_options
+                )
+                conversion_stream = StreamWriter(
+                    "conversion", **conversion_writer, **stream_options
+                )
+                with campaign_stream, conversion_stream:
+                    stream_reports(
+                        clients,
+                        googleads_service,
+                        google_category_index,
+                        window_start,
+                        window_end,
+                        campaign_stream,
+                        conversion_stream,
+                        concurrency,
+                        options=options,
+                    )
+                continue
+
+            if pipeline:
+                run_report_pipeline(
+                    clients,
+                    googleads_service,
+                    google_category_index,
+                    window_start,
+                    window_end,
+                    campaign_writer,
+                    conversion_writer,
+                    concurrency,
+                    dry_run,
+                    options=options,
+                )
+                continue
+
+            campaign_reports, conversion_reports = get_reports(
+                clients,
+                googleads_service,
+                google_category_index,
+                window_start,
+                window_end,
+                concurrency,
+                options=options,
+            )
+
+            if dry_run:
+                logger.info("Dry running. Not making any changes")
+                continue
+
+            write_reports(campaign_reports, "campaign", **campaign_writer)
+            write_reports(conversion_reports, "conversion", **conversion_writer)
+
+
+@app.command()
+def reload(
+    start_date: str,
+    end_date: str,
+    window_days: int = 30,
+    dry_run: bool = False,
+    load_mode: LoadMode = LoadMode.overwrite,
+) -> None:
+    # Reloads BigQuery from the data lake, replacing the stored rows by default
+    get_report_range(
+        start_date,
+        end_date,
+        window_days=window_days,
+        dry_run=dry_run,
+        load_mode=load_mode,
+        source=ReportSource.lake,
+    )
+
+
+@app.command()
+def backfill(
+    start_date: str,
+    end_date: str,
+    window_days: int = 30,
+    concurrency: int = 4,
+    window_concurrency: int = 2,
+    qps: float = BACKFILL_QPS,
+    search_stream: bool = True,
+    load_mode: LoadMode = LoadMode.dedup,
+    batch_rows: int = 50_000,
+    export: bool = False,
+    failed_only: bool = False,
+    refresh_lookup: bool = False,
+    refresh_accounts: bool = False,
+    transform_workers: int = 0,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+) -> None:
+    # Resumable backfill, every (client, window) unit is checkpointed in the
+    # ledger once its window is loaded, and a rerun only fetches the units
+    # that are not done yet.
+    campaign_writer, conversion_writer = get_report_writers(export, load_mode)
+
+    # prepare log file
+    logger.add(ROOT_DIR / "log/google_ads/backfill_{time}.log")
+
+    services = get_report_services(concurrency, refresh_lookup, refresh_accounts)
+    if services is None:
+        return
+    googleads_service, google_category_index, clients = services
+
+    # One request budget shared by every window and worker
+    rate_limiter = TokenBucket(qps)
+
+    transform_pool = TransformPool(transform_workers)
+    options = FetchOptions(
+        search_stream=search_stream,
+        transform_pool=transform_pool,
+        report_format=report_format,
+        compact=compact,
+    )
+
+    def fetch_unit(client_id, window_start, window_end):
+        rate_limiter.acquire()
+        df_report = fetch_report_campaign(
             client_id,
             googleads_service,
             QUERY,
-            start_date.format("YYYY-MM-DD"),
-            end_date.format("YYYY-MM-DD"),
+            window_start,
+            window_end,
+            options=options,
         )
-        if not df_report.empty:
-            campaign_reports.append(df_report)
-        df_report_conversion = get_report_campaign_conversion(
+        rate_limiter.acquire()
+        df_report_conversion = fetch_report_campaign_conversion(
             client_id,
             googleads_service,
-            google_category_lookup,
+            google_category_index,
             QUERY_CONVERSION,
-            start_date.format("YYYY-MM-DD"),
-            end_date.format("YYYY-MM-DD"),
+            window_start,
+            window_end,
+            options=options,
         )
-        if not df_report_conversion.empty:
-            conversion_reports.append(df_report_conversion)
-
-    if dry_run:
-        logger.info("Dry running. Not making any changes")
-        return
-
-    if campaign_reports:
-        df_final = pd.concat(campaign_reports, axis=0)
-        if export:
-            export_to_parquet(
-                df_final,
-                "google",
-                ROOT_DIR / f"data_lake/google_ads/campaign/{year}/{month}/{day}",
-            )
-        load_data_to_bigquery(
-            df_final,
-            bq_project_id,
-            bq_table_id,
-            google_schema,
-            ("date", "customer_id", "campaign_id"),
+        return df_report, df_report_conversion
+
+    def open_writers():
+        # A resumed window only refetches its pending clients, the lake
+        # keeps the rows of the clients done in earlier runs
+        return [
+            StreamWriter(
+                "campaign",
+                **campaign_writer,
+                batch_rows=batch_rows,
+                queue_size=concurrency,
+                keep_other_accounts=True,
+            ),
+            StreamWriter(
+                "conversion",
+                **conversion_writer,
+                batch_rows=batch_rows,
+                queue_size=concurrency,
+                keep_other_accounts=True,
+            ),
+        ]
+
+    windows = [
+        (window_start.format("YYYY-MM-DD"), window_end.format("YYYY-MM-DD"))
+        for window_start, window_end in get_date_windows(
+            start_date, end_date, window_days
         )
-    else:
-        logger.info("No campaign reports found.")
-
-    if conversion_reports:
-        df_conversion_final = pd.concat(conversion_reports, axis=0)
-        if export:
-            export_to_parquet(
-                df_conversion_final,
-                "google_conversion",
-                ROOT_DIR / f"data_lake/google_ads/conversion_goal/{year}/{month}/{day}",
-            )
-        load_data_to_bigquery(
-            df_conversion_final,
-            bq_project_id,
-            bq_table_conversion_id,
-            google_conversion_schema,
-            ("date", "customer_id", "campaign_id", "conversion_action"),
+    ]
+    with transform_pool:
+        run_backfill(
+            BackfillLedger(),
+            "google",
+            list(clients["client_id"]),
+            windows,
+            fetch_unit,
+            open_writers,
+            concurrency,
+            window_concurrency,
+            failed_only,
         )
-    else:
-        logger.info("No conversion reports found.")
 
 
 if __name__ == "__main__":
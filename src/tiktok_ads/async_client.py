@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+
+import aiohttp
+from business_api_client.rest import ApiException
+from utils.rate_limiter import TokenBucket
+
+from tiktok_ads.session import TIKTOK_REPORT_QPS, assert_tiktok_api_response
+
+TIKTOK_API_URL = "https://business-api.tiktok.com/open_api/v1.3"
+
+
+def encode_params(params: dict) -> dict:
+    # The API takes lists, objects and booleans as JSON encoded query values
+    return {
+        key: json.dumps(value) if isinstance(value, (list, dict, bool)) else str(value)
+        for key, value in params.items()
+        if value is not None
+    }
+
+
+class AsyncTiktokClient:
+    """asyncio transport for the TikTok Business API endpoints we use.
+
+    Mirrors the AuthenticationApi and ReportingApi methods of the vendored
+    SDK. HTTP errors raise the SDK's ApiException and payloads go through
+    the same assert_tiktok_api_response check, so callers handle both
+    transports alike. Use it as an async context manager.
+    """
+
+    def __init__(
+        self,
+        access_token: str | None = None,
+        max_connections: int = 100,
+        qps: float = TIKTOK_REPORT_QPS,
+        base_url: str = TIKTOK_API_URL,
+    ) -> None:
+        self.access_token = access_token
+        self.max_connections = max_connections
+        self.rate_limiter = TokenBucket(qps)
+        self.base_url = base_url.rstrip("/")
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "AsyncTiktokClient":
+        headers = {"Access-Token": self.access_token} if self.access_token else {}
+        self._session = aiohttp.ClientSession(
+            headers=headers,
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+
+    async def _request(self, method, path, params=None, body=None) -> dict:
+        await self.rate_limiter.acquire_async()
+        async with self._session.request(
+            method,
+            f"{self.base_url}{path}",
+            params=encode_params(params or {}),
+            json=body,
+        ) as response:
+            if response.status >= 400:
+                raise ApiException(status=response.status, reason=response.reason)
+            api_response = await response.json(content_type=None)
+        return assert_tiktok_api_response(api_response)
+
+    async def oauth2_advertiser_get(self, app_id, secret) -> dict:
+        return await self._request(
+            "GET",
+            "/oauth2/advertiser/get/",
+            params={"app_id": app_id, "secret": secret},
+        )
+
+    async def oauth2_access_token(self, app_id, secret, auth_code) -> dict:
+        return await self._request(
+            "POST",
+            "/oauth2/access_token/",
+            body={"app_id": app_id, "secret": secret, "auth_code": auth_code},
+        )
+
+    async def report_integrated_get(
+        self, advertiser_id, report_type, dimensions, **kwargs
+    ) -> dict:
+        return await self._request(
+            "GET",
+            "/report/integrated/get/",
+            params={
+                "advertiser_id": advertiser_id,
+                "report_type": report_type,
+                "dimensions": dimensions,
+                **kwargs,
+            },
+        )
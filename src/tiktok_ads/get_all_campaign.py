@@ -6,8 +6,6 @@ import os
 import sys
 from pathlib import Path
 
-import arrow
-import business_api_client
 import pandas as pd
 from business_api_client.rest import ApiException
 from cmk_ads.config import Config
@@ -16,34 +14,13 @@ from google.oauth2 import service_account
 from icecream import ic
 from loguru import logger
 
-ROOT_DIR = Path(__file__).absolute().parent.parent.parent
-
-
-def assert_tiktok_api_response(api_response):
-    assert isinstance(api_response, dict)
-    assert "data" in api_response
-    assert isinstance(api_response["data"], dict)
-    assert "list" in api_response["data"]
+from tiktok_ads.session import TiktokSession
+from tiktok_ads.tiktok_ads import flatten_report_rows
 
-
-def get_advertisers(app_id, secret, access_token) -> pd.DataFrame:
-    # create an instance of the API class
-    auth_api = business_api_client.AuthenticationApi()
-    try:
-        # Obtain a list of advertiser accounts that authorized an app. [Advertiser Get](https://ads.tiktok.com/marketing_api/docs?id=1738455508553729)
-        api_response = auth_api.oauth2_advertiser_get(app_id, secret, access_token)
-        assert_tiktok_api_response(api_response)
-        advertisers = pd.DataFrame(api_response["data"]["list"])
-    except ApiException as e:
-        logger.error(
-            f"Exception when calling AuthenticationApi->oauth2_advertiser_get: {e}"
-        )
-    else:
-        return advertisers
+ROOT_DIR = Path(__file__).absolute().parent.parent.parent
 
 
-def get_report_campaign(advertiser_id) -> pd.DataFrame:
-    api_instance = business_api_client.ReportingApi()
+def get_report_campaign(advertiser_id, session: TiktokSession) -> pd.DataFrame:
     report_type = "BASIC"
     dimensions = ["campaign_id"]
     service_type = "AUCTION"
@@ -62,11 +39,10 @@ def get_report_campaign(advertiser_id) -> pd.DataFrame:
 
     try:
         # Create a synchronous report task.  This endpoint can currently return the reporting data of up to 10,000 advertisements. If your number of advertisements exceeds 10,000, please use campaign_ids / adgroup_ids / ad_ids as a filter to obtain the reporting data of all advertisements in batches. Additionally, with CHUNK mode on, up to 20,000 advertisements can be returned. If you use campaign_ids / adgroup_ids / ad_ids as a filter, you can pass in up to 100 IDs at a time. [Reporting Get](https://ads.tiktok.com/marketing_api/docs?id=1740302848100353)
-        api_response = api_instance.report_integrated_get(
+        api_response = session.report_integrated_get(
             advertiser_id,
             report_type,
             dimensions,
-            access_token,
             service_type=service_type,
             data_level=data_level,
             metrics=metrics,
@@ -80,22 +56,13 @@ def get_report_campaign(advertiser_id) -> pd.DataFrame:
     except ApiException as e:
         logger.error(f"Exception when calling ReportingApi->report_integrated_get: {e}")
     else:
-        assert_tiktok_api_response(api_response)
         if api_response["data"]["page_info"]["total_number"] < 1:
             return pd.DataFrame()
         if api_response["data"]["page_info"]["total_page"] > 1:
             logger.warning(
                 f"There are more than one page for advertiser_id {advertiser_id}"
             )
-        df = pd.DataFrame(api_response["data"]["list"])
-        df = pd.concat(
-            [
-                df["dimensions"].apply(pd.Series),
-                df["metrics"].apply(pd.Series),
-            ],
-            axis=1,
-        )
-        df = df[dimensions + metrics]
+        df = flatten_report_rows(api_response["data"]["list"], dimensions, metrics)
     return df
 
 
@@ -104,11 +71,17 @@ def main():
     secret = Config().TIKTOK_SECRET
     access_token = Config().TIKTOK_ACCESS_TOKEN
 
-    advertisers = get_advertisers(app_id, secret, access_token)
+    session = TiktokSession(
+        app_id,
+        secret,
+        access_token,
+        advertisers_ttl_hours=Config().TIKTOK_ADVERTISERS_REFRESH_HOURS,
+    )
+    advertisers = session.get_advertisers()
     campaign_reports = []
     for ads_id in advertisers["advertiser_id"]:
         try:
-            df_report = get_report_campaign(ads_id)
+            df_report = get_report_campaign(ads_id, session)
             campaign_reports.append(df_report)
         except KeyError:
             logger.error(ads_id)
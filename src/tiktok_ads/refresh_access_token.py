@@ -4,11 +4,12 @@
 import os
 from pprint import pprint
 
-import business_api_client
 import typer
 from business_api_client.rest import ApiException
 from cmk_ads.config import Config
 
+from tiktok_ads.session import TiktokSession
+
 app = typer.Typer(help="Refresh Tiktok Ads Access Token")
 
 
@@ -18,14 +19,9 @@ def refresh_access_token():
     app_id = Config().TIKTOK_APP_ID
     secret = Config().TIKTOK_SECRET
 
-    api_instance = business_api_client.AuthenticationApi()
-    body = business_api_client.Oauth2AccessTokenBody(
-        auth_code=auth_code,
-        app_id=app_id,
-        secret=secret,
-    )
+    session = TiktokSession(app_id, secret, None)
     try:
-        api_response = api_instance.oauth2_access_token(body=body)
+        api_response = session.oauth2_access_token(auth_code)
         pprint(api_response)
     except ApiException as e:
         print(f"Exception when calling AuthenticationApi->oauth2_access_token: {e}")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import business_api_client
+import pandas as pd
+from attrs import define, field
+from business_api_client.rest import ApiException
+from loguru import logger
+from utils.cache import get_cache_name, read_json_cache, write_json_cache
+from utils.rate_limiter import TokenBucket
+
+# Default request budget of the reporting endpoint per developer app.
+TIKTOK_REPORT_QPS = 10
+
+ADVERTISERS_CACHE_NAME = "tiktok_advertisers"
+
+
+def get_advertisers_cache_name(app_id) -> str:
+    # Each developer app is authorized by its own advertisers
+    return get_cache_name(f"{ADVERTISERS_CACHE_NAME}_{app_id}")
+
+
+def assert_tiktok_api_response(api_response) -> dict:
+    assert isinstance(api_response, dict)
+    assert "data" in api_response
+    assert isinstance(api_response["data"], dict)
+    return api_response
+
+
+def get_api_client(pool_size: int = 1) -> business_api_client.ApiClient:
+    configuration = business_api_client.Configuration()
+    # Keep one pooled connection per worker so concurrent requests reuse
+    # keep-alive connections instead of queueing on the pool.
+    configuration.connection_pool_maxsize = max(pool_size, 1)
+    api_client = business_api_client.ApiClient(configuration)
+    api_client.set_default_header("Connection", "keep-alive")
+    return api_client
+
+
+@define
+class TiktokSession:
+    # Holds the one configured ApiClient every TikTok call goes through,
+    # the shared request rate limit and the cached advertiser list.
+    app_id: str | None
+    secret: str | None
+    access_token: str | None
+    pool_size: int = 1
+    qps: float = TIKTOK_REPORT_QPS
+    advertisers_ttl_hours: float = 24
+    api_client: business_api_client.ApiClient = field(init=False)
+    rate_limiter: TokenBucket = field(init=False)
+    auth_api: business_api_client.AuthenticationApi = field(init=False)
+    reporting_api: business_api_client.ReportingApi = field(init=False)
+    # Fetches the report pages of every advertiser, so the concurrent
+    # advertisers share pool_size page requests instead of each getting its own
+    page_executor: ThreadPoolExecutor = field(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.api_client = get_api_client(self.pool_size)
+        self.page_executor = ThreadPoolExecutor(max_workers=max(self.pool_size, 1))
+        self.rate_limiter = TokenBucket(self.qps)
+        self.auth_api = business_api_client.AuthenticationApi(self.api_client)
+        self.reporting_api = business_api_client.ReportingApi(self.api_client)
+
+    def get_advertisers(self, refresh: bool = False) -> pd.DataFrame:
+        if not refresh:
+            advertisers = read_json_cache(
+                get_advertisers_cache_name(self.app_id), self.advertisers_ttl_hours
+            )
+            if advertisers is not None:
+                logger.info("Using cached Tiktok advertisers")
+                return pd.DataFrame(advertisers)
+        try:
+            # Obtain a list of advertiser accounts that authorized an app. [Advertiser Get](https://ads.tiktok.com/marketing_api/docs?id=1738455508553729)
+            api_response = self.auth_api.oauth2_advertiser_get(
+                self.app_id, self.secret, self.access_token
+            )
+            api_response = assert_tiktok_api_response(api_response)
+        except ApiException as e:
+            logger.error(
+                f"Exception when calling AuthenticationApi->oauth2_advertiser_get: {e}"
+            )
+            return pd.DataFrame()
+        advertisers = api_response["data"]["list"]
+        # An empty list is most likely a token or app problem, caching it
+        # would skip every advertiser until the cache expires
+        if advertisers:
+            write_json_cache(get_advertisers_cache_name(self.app_id), advertisers)
+        else:
+            logger.warning("No Tiktok advertisers returned, not caching the list")
+        return pd.DataFrame(advertisers)
+
+    def report_integrated_get(self, advertiser_id, report_type, dimensions, **kwargs):
+        self.rate_limiter.acquire()
+        api_response = self.reporting_api.report_integrated_get(
+            advertiser_id, report_type, dimensions, self.access_token, **kwargs
+        )
+        return assert_tiktok_api_response(api_response)
+
+    def oauth2_access_token(self, auth_code):
+        body = business_api_client.Oauth2AccessTokenBody(
+            auth_code=auth_code,
+            app_id=self.app_id,
+            secret=self.secret,
+        )
+        return self.auth_api.oauth2_access_token(body=body)
@@ -1,222 +1,924 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
-import arrow
-import business_api_client
 import db_dtypes
-import numpy as np
 import pandas as pd
-import pandas_gbq
+import pyarrow as pa
+import pyarrow.compute as pc
 import typer
 from business_api_client.rest import ApiException
 from cmk_ads.config import Config
 from icecream import ic
 from loguru import logger
-from utils.bq_helper import (
-    export_to_parquet,
-    load_data_to_bigquery,
+from utils.arrow_helper import (
+    cast_to_schema,
+    map_column,
+    parse_numeric,
+    replace_column,
 )
-from utils.schemas import tiktok_dtypes, tiktok_schema
+from utils.backfill import BackfillLedger, run_backfill
+from utils.bq_helper import LoadMode, load_lake_to_bigquery, write_reports
+from utils.cache import read_lookup_table
+from utils.data_lake import LAKE_TABLES, ReportSource
+from utils.date_helper import check_date_range, get_date_windows, split_date_range
+from utils.fetch_options import FetchOptions
+from utils.schemas import (
+    ReportFormat,
+    tiktok_arrow_schema,
+    tiktok_dtypes,
+    tiktok_schema,
+)
+from utils.stream_writer import StreamWriter
+from utils.transform_pool import TransformPool, run_transform, run_transform_async
+
+from tiktok_ads.async_client import AsyncTiktokClient
+from tiktok_ads.session import TIKTOK_REPORT_QPS, TiktokSession
 
 ROOT_DIR = Path(__file__).absolute().parent.parent.parent
 
+# Longest date range accepted when reporting by stat_time_day.
+TIKTOK_MAX_WINDOW_DAYS = 30
+TIKTOK_MAX_PAGE_SIZE = 1000
+# Query modes to try in order, with the most rows each can return
+TIKTOK_QUERY_MODES = [("REGULAR", 10_000), ("CHUNK", 20_000)]
+
 app = typer.Typer(help="Get Tiktok Ads Campaign Report Data")
 
 
-def assert_tiktok_api_response(api_response) -> dict:
-    assert isinstance(api_response, dict)
-    assert "data" in api_response
-    assert isinstance(api_response["data"], dict)
-    return api_response
+def get_campaign_name_index(lookup_df: pd.DataFrame) -> dict:
+    # Maps each campaign_id to its standard campaign name, the first entry
+    # wins when a campaign appears more than once.
+    lookup_df = lookup_df.drop_duplicates("campaign_id", keep="first")
+    return dict(
+        zip(lookup_df["campaign_id"].astype(str), lookup_df["standard_campaign_name"])
+    )
 
 
-def fix_campaign_name(lookup_df, campaign_id):
-    campaign_names = lookup_df[lookup_df["campaign_id"] == campaign_id]
-    if campaign_names.empty:
-        return None
-    return campaign_names["standard_campaign_name"].iloc[0]
+def fix_campaign_names(df: pd.DataFrame, campaign_name_index: dict) -> pd.Series:
+    # Campaigns without a standard name keep the name reported by TikTok
+    return df["campaign_id"].map(campaign_name_index).fillna(df["campaign_name"])
 
 
-def get_advertisers(app_id, secret, access_token) -> pd.DataFrame:
-    # create an instance of the API class
-    auth_api = business_api_client.AuthenticationApi()
-    try:
-        # Obtain a list of advertiser accounts that authorized an app. [Advertiser Get](https://ads.tiktok.com/marketing_api/docs?id=1738455508553729)
-        api_response = auth_api.oauth2_advertiser_get(app_id, secret, access_token)
-        api_response = assert_tiktok_api_response(api_response)
-        return pd.DataFrame(api_response["data"]["list"])
-    except ApiException as e:
+def parse_report_metrics(
+    df: pd.DataFrame, metrics: list, dtypes: dict = tiktok_dtypes
+) -> pd.DataFrame:
+    # The API returns metrics as strings, parse the numeric ones a whole
+    # column at a time.
+    for name in metrics:
+        if dtypes.get(name) in (int, float):
+            df[name] = pd.to_numeric(df[name], errors="coerce")
+    return df
+
+
+def flatten_report_rows(
+    rows: list, dimensions: list, metrics: list, dtypes: dict | None = tiktok_dtypes
+) -> pd.DataFrame:
+    # Builds one column per dimension and metric straight from the JSON rows.
+    # The metrics are left as strings when dtypes is None.
+    columns = {
+        name: [row["dimensions"].get(name) for row in rows] for name in dimensions
+    }
+    columns.update(
+        {name: [row["metrics"].get(name) for row in rows] for name in metrics}
+    )
+    df = pd.DataFrame(columns, columns=dimensions + metrics)
+    if dtypes is None:
+        return df
+    return parse_report_metrics(df, metrics, dtypes)
+
+
+def flatten_report_table(rows: list, dimensions: list, metrics: list) -> pa.Table:
+    # Arrow version of flatten_report_rows, the metrics are left as reported
+    columns = {
+        name: pa.array([row["dimensions"].get(name) for row in rows])
+        for name in dimensions
+    }
+    columns.update(
+        {name: pa.array([row["metrics"].get(name) for row in rows]) for name in metrics}
+    )
+    return pa.table(columns)
+
+
+REPORT_DIMENSIONS = ["stat_time_day", "campaign_id"]
+REPORT_METRICS = [
+    "advertiser_id",
+    "advertiser_name",
+    "campaign_name",
+    "objective_type",
+    "reach",
+    "impressions",
+    "clicks",
+    "video_play_actions",
+    "result",
+    "checkout",
+    "spend",
+    "ctr",
+    "cpc",
+    "cost_per_result",
+]
+
+
+def get_report_params(start_date, end_date, page: int, query_mode: str) -> dict:
+    return {
+        "service_type": "AUCTION",
+        "data_level": "AUCTION_CAMPAIGN",
+        "metrics": REPORT_METRICS,
+        "order_field": "campaign_name",
+        "order_type": "ASC",
+        "start_date": start_date,
+        "end_date": end_date,
+        "page": page,
+        "page_size": TIKTOK_MAX_PAGE_SIZE,
+        "query_mode": query_mode,
+    }
+
+
+def get_report_page(
+    session: TiktokSession,
+    advertiser_id,
+    start_date,
+    end_date,
+    page: int,
+    query_mode: str = "REGULAR",
+) -> dict:
+    # Create a synchronous report task.
+    # This endpoint can currently return the reporting data of up to 10,000 advertisements.
+    # If your number of advertisements exceeds 10,000,
+    # please use campaign_ids / adgroup_ids / ad_ids as a filter to obtain the reporting data of all advertisements in batches.
+    # Additionally, with CHUNK mode on, up to 20,000 advertisements can be returned.
+    # If you use campaign_ids / adgroup_ids / ad_ids as a filter, you can pass in up to 100 IDs at a time.
+    # [Reporting Get](https://ads.tiktok.com/marketing_api/docs?id=1740302848100353)
+    return session.report_integrated_get(
+        advertiser_id,
+        "BASIC",
+        REPORT_DIMENSIONS,
+        **get_report_params(start_date, end_date, page, query_mode),
+    )
+
+
+async def get_report_page_async(
+    client: AsyncTiktokClient,
+    advertiser_id,
+    start_date,
+    end_date,
+    page: int,
+    query_mode: str = "REGULAR",
+) -> dict:
+    return await client.report_integrated_get(
+        advertiser_id,
+        "BASIC",
+        REPORT_DIMENSIONS,
+        **get_report_params(start_date, end_date, page, query_mode),
+    )
+
+
+def get_report_rows(
+    session: TiktokSession, advertiser_id, start_date, end_date
+) -> list:
+    # The first page tells how many rows and pages the report has. Reports
+    # within the REGULAR limit fetch their remaining pages concurrently,
+    # larger ones are retried in CHUNK mode and, past its limit, split into
+    # two date ranges (the rows are one per campaign and day).
+    for query_mode, row_limit in TIKTOK_QUERY_MODES:
+        api_response = get_report_page(
+            session, advertiser_id, start_date, end_date, 1, query_mode
+        )
+        page_info = api_response["data"]["page_info"]
+        if page_info["total_number"] <= row_limit:
+            break
+        logger.info(
+            f"{page_info['total_number']} rows for advertiser {advertiser_id} "
+            f"from {start_date} to {end_date} exceed the {query_mode} limit"
+        )
+    else:
+        if start_date < end_date:
+            return [
+                row
+                for date_range in split_date_range(start_date, end_date)
+                for row in get_report_rows(session, advertiser_id, *date_range)
+            ]
         logger.error(
-            f"Exception when calling AuthenticationApi->oauth2_advertiser_get: {e}"
+            f"Report for advertiser {advertiser_id} on {start_date} "
+            f"is truncated to {row_limit} rows"
         )
-        return pd.DataFrame()
 
+    if page_info["total_number"] < 1:
+        return []
+    rows = list(api_response["data"]["list"])
+    pages = range(2, page_info["total_page"] + 1)
+    if not pages:
+        return rows
+    for api_response in session.page_executor.map(
+        lambda page: get_report_page(
+            session, advertiser_id, start_date, end_date, page, query_mode
+        ),
+        pages,
+    ):
+        rows.extend(api_response["data"]["list"])
+    return rows
 
-def get_report_campaign(
-    advertiser_id, access_token, tiktok_campaign_lookup, start_date, end_date
-) -> pd.DataFrame:
-    api_instance = business_api_client.ReportingApi()
-    dimensions = ["stat_time_day", "campaign_id"]
-    metrics = [
-        "advertiser_id",
-        "advertiser_name",
-        "campaign_name",
-        "objective_type",
-        "reach",
-        "impressions",
-        "clicks",
-        "video_play_actions",
-        "result",
-        "checkout",
-        "spend",
-        "ctr",
-        "cpc",
-        "cost_per_result",
-    ]
-    page = 1
-    page_size = 1000
-    all_reports = []
-    while True:
-        try:
-            # Create a synchronous report task.
-            # This endpoint can currently return the reporting data of up to 10,000 advertisements.
-            # If your number of advertisements exceeds 10,000,
-            # please use campaign_ids / adgroup_ids / ad_ids as a filter to obtain the reporting data of all advertisements in batches.
-            # Additionally, with CHUNK mode on, up to 20,000 advertisements can be returned.
-            # If you use campaign_ids / adgroup_ids / ad_ids as a filter, you can pass in up to 100 IDs at a time.
-            # [Reporting Get](https://ads.tiktok.com/marketing_api/docs?id=1740302848100353)
-            api_response = api_instance.report_integrated_get(
-                advertiser_id,
-                "BASIC",
-                dimensions,
-                access_token,
-                service_type="AUCTION",
-                data_level="AUCTION_CAMPAIGN",
-                metrics=metrics,
-                order_field="campaign_name",
-                order_type="ASC",
-                start_date=start_date,
-                end_date=end_date,
-                page=page,
-                page_size=page_size,
-                query_mode="REGULAR",
+
+async def get_report_rows_async(
+    client: AsyncTiktokClient, advertiser_id, start_date, end_date
+) -> list:
+    # Same paging strategy as get_report_rows, with the remaining pages and
+    # split date ranges requested concurrently on the event loop.
+    for query_mode, row_limit in TIKTOK_QUERY_MODES:
+        api_response = await get_report_page_async(
+            client, advertiser_id, start_date, end_date, 1, query_mode
+        )
+        page_info = api_response["data"]["page_info"]
+        if page_info["total_number"] <= row_limit:
+            break
+        logger.info(
+            f"{page_info['total_number']} rows for advertiser {advertiser_id} "
+            f"from {start_date} to {end_date} exceed the {query_mode} limit"
+        )
+    else:
+        if start_date < end_date:
+            halves = await asyncio.gather(
+                *(
+                    get_report_rows_async(client, advertiser_id, *date_range)
+                    for date_range in split_date_range(start_date, end_date)
+                )
             )
-            api_response = assert_tiktok_api_response(api_response)
-            if api_response["data"]["page_info"]["total_number"] < 1:
-                return pd.DataFrame()
-            df = pd.DataFrame(api_response["data"]["list"])
-            all_reports.append(df)
-            if page >= api_response["data"]["page_info"]["total_page"]:
-                break
-            page += 1
-        except ApiException as e:
-            logger.error(
-                f"Exception when calling ReportingApi->report_integrated_get: {e}"
+            return [row for rows in halves for row in rows]
+        logger.error(
+            f"Report for advertiser {advertiser_id} on {start_date} "
+            f"is truncated to {row_limit} rows"
+        )
+
+    if page_info["total_number"] < 1:
+        return []
+    rows = list(api_response["data"]["list"])
+    for api_response in await asyncio.gather(
+        *(
+            get_report_page_async(
+                client, advertiser_id, start_date, end_date, page, query_mode
             )
-            return pd.DataFrame()
-    combined_df = pd.concat(all_reports, axis=0)
-    combined_df = pd.concat(
-        [
-            combined_df["dimensions"].apply(pd.Series),
-            combined_df["metrics"].apply(pd.Series),
-        ],
-        axis=1,
+            for page in range(2, page_info["total_page"] + 1)
+        )
+    ):
+        rows.extend(api_response["data"]["list"])
+    return rows
+
+
+def fetch_report_campaign(
+    advertiser_id,
+    session: TiktokSession,
+    campaign_name_index,
+    start_date,
+    end_date,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
+    # Raises the ApiException of a failed request
+    all_reports = get_report_rows(session, advertiser_id, start_date, end_date)
+    return transform_report_campaign(all_reports, campaign_name_index, options=options)
+
+
+def get_report_campaign(
+    advertiser_id,
+    session: TiktokSession,
+    campaign_name_index,
+    start_date,
+    end_date,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
+    try:
+        return fetch_report_campaign(
+            advertiser_id,
+            session,
+            campaign_name_index,
+            start_date,
+            end_date,
+            options=options,
+        )
+    except ApiException as e:
+        logger.error(f"Exception when calling ReportingApi->report_integrated_get: {e}")
+        return pd.DataFrame()
+
+
+async def get_report_campaign_async(
+    advertiser_id,
+    client: AsyncTiktokClient,
+    campaign_name_index,
+    start_date,
+    end_date,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
+    try:
+        all_reports = await get_report_rows_async(
+            client, advertiser_id, start_date, end_date
+        )
+    except ApiException as e:
+        logger.error(f"Exception when calling ReportingApi->report_integrated_get: {e}")
+        return pd.DataFrame()
+    if options.report_format == ReportFormat.arrow:
+        return options.finish_report(
+            transform_report_table(all_reports, campaign_name_index)
+        )
+    combined_df = flatten_report_rows(
+        all_reports, REPORT_DIMENSIONS, REPORT_METRICS, dtypes=None
     )
-    combined_df = combined_df[dimensions + metrics]
     if combined_df.empty:
         return pd.DataFrame()
+    # Awaits the worker process instead of blocking the event loop
+    report_df = await run_transform_async(
+        options.transform_pool,
+        normalize_report_campaign,
+        combined_df,
+        campaign_name_index,
+    )
+    return options.finish_report(report_df)
+
+
+def normalize_report_campaign(
+    combined_df: pd.DataFrame, campaign_name_index: dict
+) -> pd.DataFrame:
+    # The CPU bound part of the transform, from the raw report columns to the
+    # staging table frame. Runs in a TransformPool worker when one is given.
+    combined_df = parse_report_metrics(combined_df, REPORT_METRICS)
     combined_df["stat_time_day"] = pd.to_datetime(combined_df["stat_time_day"])
     combined_df["stat_time_day"] = combined_df["stat_time_day"].astype("dbdate")
-    combined_df[metrics[4:]] = combined_df[metrics[4:]].apply(
-        pd.to_numeric, errors="coerce"
-    )
     combined_df = combined_df[combined_df["impressions"] > 0].reset_index(drop=True)
     combined_df = combined_df.rename({"stat_time_day": "date"}, axis=1)
-    combined_df["standard_campaign_name"] = combined_df["campaign_id"].apply(
-        lambda x: fix_campaign_name(tiktok_campaign_lookup, x)
+    combined_df["campaign_name"] = fix_campaign_names(combined_df, campaign_name_index)
+    return combined_df[tiktok_dtypes.keys()]
+
+
+def normalize_report_table(
+    combined_table: pa.Table, campaign_name_index: dict
+) -> pa.Table:
+    # Arrow version of normalize_report_campaign
+    for name in REPORT_METRICS:
+        if tiktok_dtypes.get(name) in (int, float):
+            combined_table = replace_column(
+                combined_table, name, parse_numeric(combined_table[name])
+            )
+    combined_table = combined_table.filter(pc.greater(combined_table["impressions"], 0))
+    # stat_time_day is reported as a timestamp at midnight
+    stat_time_day = pc.cast(combined_table["stat_time_day"], pa.timestamp("s"))
+    combined_table = replace_column(
+        combined_table, "stat_time_day", pc.cast(stat_time_day, pa.date32())
     )
-    combined_df["campaign_name"] = np.where(
-        pd.isna(combined_df["standard_campaign_name"]),
-        combined_df["campaign_name"],
-        combined_df["standard_campaign_name"],
+    combined_table = combined_table.rename_columns(
+        [
+            "date" if name == "stat_time_day" else name
+            for name in combined_table.column_names
+        ]
     )
-    return combined_df[tiktok_dtypes.keys()]
+    campaign_names = map_column(combined_table["campaign_id"], campaign_name_index)
+    combined_table = replace_column(
+        combined_table,
+        "campaign_name",
+        pc.coalesce(campaign_names, combined_table["campaign_name"]),
+    )
+    return cast_to_schema(combined_table, tiktok_arrow_schema)
 
 
-@app.command()
-def get_report(
-    date: str,
-    export: bool = False,
-    dry_run: bool = False,
+def transform_report_table(all_reports: list, campaign_name_index) -> pa.Table:
+    if not all_reports:
+        return pa.table({})
+    combined_table = flatten_report_table(
+        all_reports, REPORT_DIMENSIONS, REPORT_METRICS
+    )
+    return normalize_report_table(combined_table, campaign_name_index)
+
+
+def transform_report_campaign(
+    all_reports: list,
+    campaign_name_index,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> pd.DataFrame | pa.Table:
+    if options.report_format == ReportFormat.arrow:
+        return options.finish_report(
+            transform_report_table(all_reports, campaign_name_index)
+        )
+    combined_df = flatten_report_rows(
+        all_reports, REPORT_DIMENSIONS, REPORT_METRICS, dtypes=None
+    )
+    if combined_df.empty:
+        return pd.DataFrame()
+    report_df = run_transform(
+        options.transform_pool,
+        normalize_report_campaign,
+        combined_df,
+        campaign_name_index,
+    )
+    return options.finish_report(report_df)
+
+
+def get_reports(
+    advertisers: pd.DataFrame,
+    session: TiktokSession,
+    campaign_name_index: dict,
+    start_date: str,
+    end_date: str,
+    concurrency: int = 1,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> list[pd.DataFrame | pa.Table]:
+    campaign_reports = []
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = [
+            (
+                ads_id,
+                executor.submit(
+                    get_report_campaign,
+                    ads_id,
+                    session,
+                    campaign_name_index,
+                    start_date,
+                    end_date,
+                    options=options,
+                ),
+            )
+            for ads_id in advertisers["advertiser_id"]
+        ]
+        # Waiting on each advertiser in turn keeps the advertiser order
+        for ads_id, future in futures:
+            try:
+                df_report = future.result()
+            except Exception as e:
+                logger.error(f"Failed to get report for advertiser {ads_id}: {e}")
+                continue
+            if len(df_report):
+                campaign_reports.append(df_report)
+    return campaign_reports
+
+
+async def get_reports_async(
+    advertisers: pd.DataFrame,
+    access_token: str,
+    campaign_name_index: dict,
+    start_date: str,
+    end_date: str,
+    concurrency: int = 1,
+    qps: float = TIKTOK_REPORT_QPS,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> list[pd.DataFrame | pa.Table]:
+    # Every advertiser is in flight at once, bounded by the connection limit
+    # and the shared rate limit of the client.
+    async with AsyncTiktokClient(
+        access_token, max_connections=max(concurrency, 1), qps=qps
+    ) as client:
+        results = await asyncio.gather(
+            *(
+                get_report_campaign_async(
+                    ads_id,
+                    client,
+                    campaign_name_index,
+                    start_date,
+                    end_date,
+                    options=options,
+                )
+                for ads_id in advertisers["advertiser_id"]
+            ),
+            return_exceptions=True,
+        )
+    campaign_reports = []
+    for ads_id, df_report in zip(advertisers["advertiser_id"], results):
+        if isinstance(df_report, Exception):
+            logger.error(f"Failed to get report for advertiser {ads_id}: {df_report}")
+            continue
+        if len(df_report):
+            campaign_reports.append(df_report)
+    return campaign_reports
+
+
+def stream_reports(
+    advertisers: pd.DataFrame,
+    session: TiktokSession,
+    campaign_name_index: dict,
+    start_date: str,
+    end_date: str,
+    writer: StreamWriter,
+    concurrency: int = 1,
+    *,
+    options: FetchOptions = FetchOptions(),
+) -> None:
+    # Each task hands its frame to the writer as soon as it is fetched, the
+    # bounded writer queue holds back the workers when loading falls behind.
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for ads_id in advertisers["advertiser_id"]:
+            executor.submit(
+                writer.fetch_into,
+                f"report for advertiser {ads_id}",
+                get_report_campaign,
+                ads_id,
+                session,
+                campaign_name_index,
+                start_date,
+                end_date,
+                options=options,
+            )
+
+
+async def stream_reports_async(
+    advertisers: pd.DataFrame,
+    access_token: str,
+    campaign_name_index: dict,
+    start_date: str,
+    end_date: str,
+    writer: StreamWriter,
+    concurrency: int = 1,
+    qps: float = TIKTOK_REPORT_QPS,
+    *,
+    options: FetchOptions = FetchOptions(),
 ) -> None:
-    app_id = Config().TIKTOK_APP_ID
-    secret = Config().TIKTOK_SECRET
-    access_token = Config().TIKTOK_ACCESS_TOKEN
+    # The semaphore keeps at most `concurrency` advertisers between fetch and
+    # hand-off, so finished frames cannot pile up while the writer is busy.
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def fetch_into(client, ads_id) -> None:
+        async with semaphore:
+            try:
+                df_report = await get_report_campaign_async(
+                    ads_id,
+                    client,
+                    campaign_name_index,
+                    start_date,
+                    end_date,
+                    options=options,
+                )
+            except Exception as e:
+                logger.error(f"Failed to get report for advertiser {ads_id}: {e}")
+                return
+            # put blocks while the writer queue is full, keep it off the loop
+            await asyncio.to_thread(writer.put, df_report)
+
+    async with AsyncTiktokClient(
+        access_token, max_connections=max(concurrency, 1), qps=qps
+    ) as client:
+        await asyncio.gather(
+            *(fetch_into(client, ads_id) for ads_id in advertisers["advertiser_id"])
+        )
+
+
+def get_report_writer(
+    export: bool = False, load_mode: LoadMode = LoadMode.dedup
+) -> dict:
+    # Destination of the campaign reports, as the keyword arguments of
+    # write_reports and StreamWriter
     bq_project_id = Config().BIGQUERY_PROJECT_ID
     bq_dataset_id = Config().BIGQUERY_DATASET_ID
     bq_table_id = Config().BIGQUERY_TABLE_TIKTOK_STAGING_ID
     bq_table_id = f"{bq_project_id}.{bq_dataset_id}.{bq_table_id}"
+    return dict(
+        export_dir=LAKE_TABLES["tiktok"],
+        bq_project_id=bq_project_id,
+        bq_table_id=bq_table_id,
+        schema=tiktok_schema,
+        composite_primary_key=("date", "advertiser_id", "campaign_id"),
+        export=export,
+        load_mode=load_mode,
+    )
+
+
+def clamp_window_days(window_days: int) -> int:
+    if window_days > TIKTOK_MAX_WINDOW_DAYS:
+        logger.warning(
+            f"Tiktok daily reports span at most {TIKTOK_MAX_WINDOW_DAYS} days, "
+            f"using {TIKTOK_MAX_WINDOW_DAYS} day windows"
+        )
+        return TIKTOK_MAX_WINDOW_DAYS
+    return window_days
+
+
+def get_report_services(
+    concurrency: int = 1,
+    qps: float = TIKTOK_REPORT_QPS,
+    refresh_lookup: bool = False,
+    refresh_advertisers: bool = False,
+) -> tuple[TiktokSession, dict, pd.DataFrame] | None:
+    # Returns the session, the campaign name index and the advertisers, or
+    # None when the lookup table or the advertisers are unavailable.
+    bq_project_id = Config().BIGQUERY_PROJECT_ID
+    bq_dataset_id = Config().BIGQUERY_DATASET_ID
     bq_campaign_lookup_id = Config().BIGQUERY_TABLE_TIKTOK_CAMPAIGN_LOOKUP_ID
     bq_campaign_lookup_id = f"{bq_project_id}.{bq_dataset_id}.{bq_campaign_lookup_id}"
 
-    tiktok_campaign_lookup = pandas_gbq.read_gbq(bq_campaign_lookup_id, bq_project_id)
+    tiktok_campaign_lookup = read_lookup_table(
+        bq_campaign_lookup_id,
+        bq_project_id,
+        Config().LOOKUP_CACHE_TTL_HOURS,
+        refresh_lookup,
+    )
     if tiktok_campaign_lookup is None:
-        return
+        return None
+    campaign_name_index = get_campaign_name_index(tiktok_campaign_lookup)
+
+    # All workers share one pooled API client and one rate limit.
+    session = TiktokSession(
+        Config().TIKTOK_APP_ID,
+        Config().TIKTOK_SECRET,
+        Config().TIKTOK_ACCESS_TOKEN,
+        pool_size=concurrency,
+        qps=qps,
+        advertisers_ttl_hours=Config().TIKTOK_ADVERTISERS_REFRESH_HOURS,
+    )
+    advertisers = session.get_advertisers(refresh_advertisers)
+    if advertisers.empty:
+        logger.error("No advertisers found.")
+        return None
+    return session, campaign_name_index, advertisers
+
+
+@app.command()
+def get_report(
+    date: str,
+    export: bool = False,
+    dry_run: bool = False,
+    concurrency: int = 1,
+    qps: float = TIKTOK_REPORT_QPS,
+    load_mode: LoadMode = LoadMode.dedup,
+    refresh_lookup: bool = False,
+    refresh_advertisers: bool = False,
+    async_transport: bool = False,
+    stream: bool = False,
+    batch_rows: int = 50_000,
+    source: ReportSource = ReportSource.api,
+    transform_workers: int = 0,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+) -> None:
+    get_report_range(
+        date,
+        date,
+        export=export,
+        dry_run=dry_run,
+        concurrency=concurrency,
+        qps=qps,
+        load_mode=load_mode,
+        refresh_lookup=refresh_lookup,
+        refresh_advertisers=refresh_advertisers,
+        async_transport=async_transport,
+        stream=stream,
+        batch_rows=batch_rows,
+        source=source,
+        transform_workers=transform_workers,
+        report_format=report_format,
+        compact=compact,
+    )
 
-    # Set the start date and end date for daily run
-    start_date = arrow.get(date, tzinfo="local").floor("day")
-    end_date = start_date.ceil("day")
-    year = start_date.format("YYYY")
-    month = start_date.format("MM")
-    day = start_date.format("DD")
+
+@app.command()
+def get_report_range(
+    start_date: str,
+    end_date: str,
+    window_days: int = TIKTOK_MAX_WINDOW_DAYS,
+    export: bool = False,
+    dry_run: bool = False,
+    concurrency: int = 1,
+    qps: float = TIKTOK_REPORT_QPS,
+    load_mode: LoadMode = LoadMode.dedup,
+    refresh_lookup: bool = False,
+    refresh_advertisers: bool = False,
+    async_transport: bool = False,
+    stream: bool = False,
+    batch_rows: int = 50_000,
+    source: ReportSource = ReportSource.api,
+    transform_workers: int = 0,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+) -> None:
+    check_date_range(start_date, end_date)
+    report_writer = get_report_writer(export, load_mode)
 
     # prepare log file
     logger.add(ROOT_DIR / "log/tiktok_ads/report_{time}.log")
 
-    logger.info(f"Getting Tiktok Report for {start_date.format('YYYY-MM-DD')}")
+    if source == ReportSource.lake:
+        # The lake holds transformed reports with fixed campaign names, and
+        # the API's window limit does not apply to it.
+        for window_start, window_end in get_date_windows(
+            start_date, end_date, window_days
+        ):
+            window_start = window_start.format("YYYY-MM-DD")
+            window_end = window_end.format("YYYY-MM-DD")
+            logger.info(
+                f"Loading Tiktok Report for {window_start} to {window_end} "
+                "from the data lake"
+            )
+            load_lake_to_bigquery(
+                "campaign",
+                window_start,
+                window_end,
+                **report_writer,
+                dry_run=dry_run,
+            )
+        return
 
-    advertisers = get_advertisers(app_id, secret, access_token)
-    if advertisers.empty:
-        logger.error("No advertisers found.")
+    window_days = clamp_window_days(window_days)
+
+    services = get_report_services(
+        concurrency, qps, refresh_lookup, refresh_advertisers
+    )
+    if services is None:
         return
+    session, campaign_name_index, advertisers = services
 
-    campaign_reports = []
-    for ads_id in advertisers["advertiser_id"]:
-        df_report = get_report_campaign(
-            ads_id,
-            access_token,
-            tiktok_campaign_lookup,
-            start_date.format("YYYY-MM-DD"),
-            end_date.format("YYYY-MM-DD"),
-        )
-        if not df_report.empty:
-            campaign_reports.append(df_report)
+    with TransformPool(transform_workers) as transform_pool:
+        options = FetchOptions(
+            transform_pool=transform_pool,
+            report_format=report_format,
+            compact=compact,
+        )
+        # The advertiser list and lookup table are shared by every window,
+        # each window costs one paged query per advertiser.
+        for window_start, window_end in get_date_windows(
+            start_date, end_date, window_days
+        ):
+            window_start = window_start.format("YYYY-MM-DD")
+            window_end = window_end.format("YYYY-MM-DD")
+            logger.info(f"Getting Tiktok Report for {window_start} to {window_end}")
+            logger.info(
+                f"Fetching reports for {len(advertisers)} advertisers "
+                f"with concurrency {concurrency} at {qps} QPS"
+            )
+
+            if stream:
+                with StreamWriter(
+                    "campaign",
+                    **report_writer,
+                    batch_rows=batch_rows,
+                    queue_size=concurrency,
+                    dry_run=dry_run,
+                ) as writer:
+                    if async_transport:
+                        asyncio.run(
+                            stream_reports_async(
+                                advertisers,
+                                session.access_token,
+                                campaign_name_index,
+                                window_start,
+                                window_end,
+                                writer,
+                                concurrency,
+                                qps,
+                                options=options,
+                            )
+                        )
+                    else:
+                        stream_reports(
+                            advertisers,
+                            session,
+                            campaign_name_index,
+                            window_start,
+                            window_end,
+                            writer,
+                            concurrency,
+                            options=options,
+                        )
+                continue
+
+            if async_transport:
+                campaign_reports = asyncio.run(
+                    get_reports_async(
+                        advertisers,
+                        session.access_token,
+                        campaign_name_index,
+                        window_start,
+                        window_end,
+                        concurrency,
+                        qps,
+                        options=options,
+                    )
+                )
+            else:
+                campaign_reports = get_reports(
+                    advertisers,
+                    session,
+                    campaign_name_index,
+                    window_start,
+                    window_end,
+                    concurrency,
+                    options=options,
+                )
+
+            if dry_run:
+                logger.info("Dry running. Not making any changes")
+                continue
+
+            write_reports(campaign_reports, "campaign", **report_writer)
+
+
+@app.command()
+def reload(
+    start_date: str,
+    end_date: str,
+    window_days: int = TIKTOK_MAX_WINDOW_DAYS,
+    dry_run: bool = False,
+    load_mode: LoadMode = LoadMode.overwrite,
+) -> None:
+    # Reloads BigQuery from the data lake, replacing the stored rows by default
+    get_report_range(
+        start_date,
+        end_date,
+        window_days=window_days,
+        dry_run=dry_run,
+        load_mode=load_mode,
+        source=ReportSource.lake,
+    )
+
+
+@app.command()
+def backfill(
+    start_date: str,
+    end_date: str,
+    window_days: int = TIKTOK_MAX_WINDOW_DAYS,
+    concurrency: int = 4,
+    window_concurrency: int = 2,
+    qps: float = TIKTOK_REPORT_QPS,
+    load_mode: LoadMode = LoadMode.dedup,
+    batch_rows: int = 50_000,
+    export: bool = False,
+    failed_only: bool = False,
+    refresh_lookup: bool = False,
+    refresh_advertisers: bool = False,
+    transform_workers: int = 0,
+    report_format: ReportFormat = ReportFormat.pandas,
+    compact: bool = False,
+) -> None:
+    # Resumable backfill, every (advertiser, window) unit is checkpointed in
+    # the ledger once its window is loaded, and a rerun only fetches the
+    # units that are not done yet.
+    report_writer = get_report_writer(export, load_mode)
+
+    # prepare log file
+    logger.add(ROOT_DIR / "log/tiktok_ads/backfill_{time}.log")
 
-    if dry_run:
-        logger.info("Dry running. Not making any changes")
+    window_days = clamp_window_days(window_days)
+
+    # The session's rate limit is shared by every window and worker
+    services = get_report_services(
+        concurrency, qps, refresh_lookup, refresh_advertisers
+    )
+    if services is None:
         return
+    session, campaign_name_index, advertisers = services
+
+    transform_pool = TransformPool(transform_workers)
+    options = FetchOptions(
+        transform_pool=transform_pool,
+        report_format=report_format,
+        compact=compact,
+    )
 
-    if campaign_reports:
-        df_final = pd.concat(campaign_reports, axis=0)
-        if export:
-            export_to_parquet(
-                df_final,
-                "tiktok",
-                ROOT_DIR / f"data_lake/tiktok_ads/{year}/{month}/{day}",
+    def fetch_unit(advertiser_id, window_start, window_end):
+        return (
+            fetch_report_campaign(
+                advertiser_id,
+                session,
+                campaign_name_index,
+                window_start,
+                window_end,
+                options=options,
+            ),
+        )
+
+    def open_writers():
+        # A resumed window only refetches its pending advertisers, the lake
+        # keeps the rows of the advertisers done in earlier runs
+        return [
+            StreamWriter(
+                "campaign",
+                **report_writer,
+                batch_rows=batch_rows,
+                queue_size=concurrency,
+                keep_other_accounts=True,
             )
-        load_data_to_bigquery(
-            df_final,
-            bq_project_id,
-            bq_table_id,
-            tiktok_schema,
-            ("date", "advertiser_id", "campaign_id"),
+        ]
+
+    windows = [
+        (window_start.format("YYYY-MM-DD"), window_end.format("YYYY-MM-DD"))
+        for window_start, window_end in get_date_windows(
+            start_date, end_date, window_days
+        )
+    ]
+    with transform_pool:
+        run_backfill(
+            BackfillLedger(),
+            "tiktok",
+            list(advertisers["advertiser_id"]),
+            windows,
+            fetch_unit,
+            open_writers,
+            concurrency,
+            window_concurrency,
+            failed_only,
         )
-    else:
-        logger.info("No campaign reports found.")
 
 
 if __name__ == "__main__":
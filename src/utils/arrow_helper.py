@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Strings pd.to_numeric accepts, anything else is parsed as null
+NUMERIC_PATTERN = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+
+
+def cast_to_schema(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    # Orders the columns like the schema and casts them to its types, which
+    # also parses ISO date strings and turns integer ids into strings.
+    return table.select(schema.names).cast(schema)
+
+
+def map_column(column, index: dict, value_type=pa.string()):
+    # Arrow version of Series.map(dict), values missing from the index are null
+    keys = pa.array(list(index), column.type)
+    values = pa.array(list(index.values()), value_type)
+    return pc.take(values, pc.index_in(column, value_set=keys))
+
+
+def parse_numeric(column):
+    # Arrow version of pd.to_numeric(errors="coerce"), the values come back
+    # as float64 and the schema cast narrows them to the target type.
+    if pa.types.is_string(column.type):
+        column = pc.if_else(
+            pc.match_substring_regex(column, NUMERIC_PATTERN), column, None
+        )
+    return pc.cast(column, pa.float64())
+
+
+def replace_column(table: pa.Table, name: str, column) -> pa.Table:
+    return table.set_column(table.schema.get_field_index(name), name, column)
+
+
+def key_column(table: pa.Table, keys) -> pa.ChunkedArray:
+    # Joins the key columns into one string per row so composite keys can be
+    # compared with is_in
+    return pc.binary_join_element_wise(
+        *(pc.cast(table[key], pa.string()) for key in keys), "\x1f"
+    )
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from enum import Enum
+from pathlib import Path
+
+import arrow
+import typer
+from loguru import logger
+
+ROOT_DIR = Path(__file__).absolute().parent.parent.parent
+
+LEDGER_PATH = ROOT_DIR / "state/backfill.sqlite3"
+
+app = typer.Typer(help="Manage the Backfill Ledger")
+
+
+class UnitStatus(str, Enum):
+    # done: the unit's rows were loaded to BigQuery
+    # failed: fetching the unit, or loading its window, raised an error
+    done = "done"
+    failed = "failed"
+
+
+class BackfillLedger:
+    """Checkpoint ledger of the backfill units.
+
+    A unit is one (source, account, date window). Units are recorded when
+    their fetch fails or once their window is loaded, so a rerun can skip
+    everything already done. One SQLite connection is shared by every
+    window thread behind a lock.
+    """
+
+    def __init__(self, path: Path = LEDGER_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS units (
+                    source TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    window_start TEXT NOT NULL,
+                    window_end TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (source, account, window_start, window_end)
+                )
+                """
+            )
+
+    def get_statuses(self, source, window_start, window_end) -> dict[str, str]:
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT account, status FROM units
+                WHERE source = ? AND window_start = ? AND window_end = ?
+                """,
+                (source, window_start, window_end),
+            ).fetchall()
+        return dict(rows)
+
+    def record(
+        self, source, accounts, window_start, window_end, status, error=None
+    ) -> None:
+        now = arrow.utcnow().isoformat()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO units (
+                    source, account, window_start, window_end,
+                    status, attempts, error, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT (source, account, window_start, window_end)
+                DO UPDATE SET
+                    status = excluded.status,
+                    attempts = attempts + 1,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+                """,
+                [
+                    (source, account, window_start, window_end, status, error, now)
+                    for account in accounts
+                ],
+            )
+
+    def summary(self, source=None) -> list[tuple]:
+        query = "SELECT source, status, COUNT(*) FROM units"
+        params = ()
+        if source is not None:
+            query += " WHERE source = ?"
+            params = (source,)
+        with self._lock:
+            return self._connection.execute(
+                f"{query} GROUP BY source, status ORDER BY source, status", params
+            ).fetchall()
+
+    def failures(self, source=None) -> list[tuple]:
+        query = """
+        SELECT source, account, window_start, window_end, attempts, error
+        FROM units WHERE status = ?
+        """
+        params = (UnitStatus.failed.value,)
+        if source is not None:
+            query += " AND source = ?"
+            params += (source,)
+        with self._lock:
+            return self._connection.execute(
+                f"{query} ORDER BY source, window_start, account", params
+            ).fetchall()
+
+    def reset(self, source=None) -> None:
+        with self._lock, self._connection:
+            if source is None:
+                self._connection.execute("DELETE FROM units")
+            else:
+                self._connection.execute(
+                    "DELETE FROM units WHERE source = ?", (source,)
+                )
+
+
+def run_backfill_window(
+    ledger: BackfillLedger,
+    source: str,
+    accounts: list[str],
+    window_start: str,
+    window_end: str,
+    fetch_unit,
+    open_writers,
+    executor: ThreadPoolExecutor,
+    failed_only: bool = False,
+) -> None:
+    statuses = ledger.get_statuses(source, window_start, window_end)
+    if failed_only:
+        pending = [
+            account
+            for account in accounts
+            if statuses.get(account) == UnitStatus.failed
+        ]
+    else:
+        pending = [
+            account for account in accounts if statuses.get(account) != UnitStatus.done
+        ]
+    if not pending:
+        logger.info(f"{source} {window_start} to {window_end} already done")
+        return
+    logger.info(
+        f"Backfilling {source} {window_start} to {window_end} "
+        f"for {len(pending)} of {len(accounts)} accounts"
+    )
+
+    def run_unit(account, writers) -> None:
+        # The frames are handed to the window's writers from the worker, so
+        # a slow load holds back the fetches instead of buffering results.
+        frames = fetch_unit(account, window_start, window_end)
+        for writer, df in zip(writers, frames):
+            writer.put(df)
+
+    fetched = []
+    try:
+        with ExitStack() as stack:
+            writers = [stack.enter_context(writer) for writer in open_writers()]
+            futures = [
+                (account, executor.submit(run_unit, account, writers))
+                for account in pending
+            ]
+            for account, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(
+                        f"Failed to get {source} report for account {account} "
+                        f"from {window_start} to {window_end}: {e}"
+                    )
+                    ledger.record(
+                        source,
+                        [account],
+                        window_start,
+                        window_end,
+                        UnitStatus.failed,
+                        str(e),
+                    )
+                    continue
+                fetched.append(account)
+    except Exception as e:
+        # The load of the window failed, none of its units reached BigQuery
+        logger.error(f"Failed to load {source} {window_start} to {window_end}: {e}")
+        ledger.record(
+            source, fetched, window_start, window_end, UnitStatus.failed, str(e)
+        )
+        return
+    ledger.record(source, fetched, window_start, window_end, UnitStatus.done)
+    logger.info(
+        f"Backfilled {source} {window_start} to {window_end}: "
+        f"{len(fetched)} done, {len(pending) - len(fetched)} failed"
+    )
+
+
+def run_backfill(
+    ledger: BackfillLedger,
+    source: str,
+    accounts: list[str],
+    windows: list[tuple[str, str]],
+    fetch_unit,
+    open_writers,
+    concurrency: int = 1,
+    window_concurrency: int = 1,
+    failed_only: bool = False,
+) -> None:
+    # fetch_unit(account, window_start, window_end) returns one frame per
+    # writer and raises on failure. open_writers() returns fresh
+    # StreamWriters for a window, which load it to BigQuery when closed.
+    # Windows run in parallel and share one pool of fetch workers, so the
+    # number of requests in flight stays bounded by concurrency while any
+    # rate limit lives in fetch_unit.
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    window_executor = ThreadPoolExecutor(max_workers=max(window_concurrency, 1))
+    with executor, window_executor:
+        futures = [
+            window_executor.submit(
+                run_backfill_window,
+                ledger,
+                source,
+                accounts,
+                window_start,
+                window_end,
+                fetch_unit,
+                open_writers,
+                executor,
+                failed_only,
+            )
+            for window_start, window_end in windows
+        ]
+        for future in futures:
+            future.result()
+    for _, status, count in ledger.summary(source):
+        logger.info(f"{source} backfill units {status}: {count}")
+
+
+@app.command()
+def status(source: str | None = None) -> None:
+    ledger = BackfillLedger()
+    for source_name, unit_status, count in ledger.summary(source):
+        print(f"{source_name:<10} {unit_status:<8} {count}")
+    for failure in ledger.failures(source):
+        source_name, account, window_start, window_end, attempts, error = failure
+        print(
+            f"{source_name:<10} {account:<20} {window_start} {window_end} "
+            f"attempts={attempts} {error}"
+        )
+
+
+@app.command()
+def reset(source: str | None = None) -> None:
+    # Forgets the recorded units of one source, or of every source
+    BackfillLedger().reset(source)
+    logger.info(f"Reset the backfill ledger for {source or 'every source'}")
+
+
+if __name__ == "__main__":
+    app()
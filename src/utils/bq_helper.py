@@ -1,83 +1,321 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
+import uuid
+from datetime import timedelta
+from enum import Enum
+from functools import lru_cache
 from pathlib import Path
 
 import arrow
 import pandas as pd
-import pandas_gbq
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.cloud import bigquery
 from loguru import logger
 
-from utils.schemas import google_conversion_dtypes, google_dtypes, tiktok_dtypes
+from utils.arrow_helper import cast_to_schema, key_column
+from utils.data_lake import read_lake, write_to_lake
+from utils.schemas import bq_schema_to_arrow
 
 ROOT_DIR = Path(__file__).absolute().parent.parent.parent
 
+# Temporary tables are dropped after use, the expiration only covers crashes
+TEMPORARY_TABLE_EXPIRATION = timedelta(hours=1)
+
+
+class LoadMode(str, Enum):
+    # dedup: download existing keys and append the missing rows, the default
+    # merge: stage the rows in a temporary table and MERGE them in BigQuery,
+    #     needs permission to create tables in the target dataset
+    # overwrite: replace the stored rows of every date and account in the batch
+    dedup = "dedup"
+    merge = "merge"
+    overwrite = "overwrite"
+
+
+@lru_cache
+def get_bigquery_client(project_id) -> bigquery.Client:
+    return bigquery.Client(project_id)
+
+
+def dataframe_to_arrow(df, schema) -> pa.Table:
+    # Converts the frame once, with the column types of the BigQuery schema
+    return pa.Table.from_pandas(
+        df[[field.name for field in schema]],
+        schema=bq_schema_to_arrow(schema),
+        preserve_index=False,
+    )
+
+
+def report_to_arrow(report, schema) -> pa.Table:
+    # Reports are DataFrames or, with the arrow report format, Arrow tables
+    # that only need their columns ordered and cast to the BigQuery types
+    if isinstance(report, pa.Table):
+        return cast_to_schema(report, bq_schema_to_arrow(schema))
+    return dataframe_to_arrow(report, schema)
+
+
+def get_date_range(table: pa.Table, date_key) -> tuple:
+    date_range = pc.min_max(table[date_key]).as_py()
+    return date_range["min"], date_range["max"]
+
 
 def check_existing_bigquery(
-    df, project_id, table_id, composite_primary_key
-) -> pd.DataFrame:
-    if len(composite_primary_key) > 3:
-        date_key, customer_key, campaign_key, conversion_key = composite_primary_key
-        # Query existing records from BigQuery
-        query = f"""
-        SELECT {date_key}, {customer_key}, {campaign_key}, {conversion_key}
-        FROM `{table_id}`
-        WHERE {date_key} BETWEEN '{df[date_key].min().strftime('%Y-%m-%d')}' AND '{df[date_key].max().strftime('%Y-%m-%d')}'
-        """
-        dtypes = google_conversion_dtypes
-    else:
-        date_key, customer_key, campaign_key = composite_primary_key
-        # Query existing records from BigQuery
-        query = f"""
-        SELECT {date_key}, {customer_key}, {campaign_key}
-        FROM `{table_id}`
-        WHERE {date_key} BETWEEN '{df[date_key].min().strftime('%Y-%m-%d')}' AND '{df[date_key].max().strftime('%Y-%m-%d')}'
-        """
-        if "tiktok" in project_id:
-            dtypes = tiktok_dtypes
-        else:
-            dtypes = google_dtypes
-    dtypes = {k: v for k, v in dtypes.items() if k in composite_primary_key}
-    existing_records = pandas_gbq.read_gbq(
-        query,
-        project_id,
-        dtypes=dtypes,
+    table, project_id, table_id, composite_primary_key
+) -> pa.Table:
+    date_key = composite_primary_key[0]
+    start_date, end_date = get_date_range(table, date_key)
+    # Query existing records from BigQuery
+    query = f"""
+    SELECT DISTINCT {', '.join(composite_primary_key)}
+    FROM `{table_id}`
+    WHERE {date_key} BETWEEN '{start_date.strftime('%Y-%m-%d')}' AND '{end_date.strftime('%Y-%m-%d')}'
+    """
+    existing_records = get_bigquery_client(project_id).query(query).to_arrow()
+    if not existing_records.num_rows:
+        return table
+    # Remove existing records from the table
+    existing_keys = key_column(existing_records, composite_primary_key)
+    is_existing = pc.is_in(
+        key_column(table, composite_primary_key),
+        value_set=existing_keys.combine_chunks(),
     )
-    if existing_records is None:
-        return df
-    if existing_records.empty:
-        return df
-    # Remove existing records from the DataFrame
-    df = df.merge(
-        existing_records,
-        on=composite_primary_key,
-        how="left",
-        indicator=True,
+    return table.filter(pc.invert(is_existing))
+
+
+def load_parquet_to_bigquery(
+    client,
+    df,
+    table_id,
+    schema,
+    write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+) -> bigquery.LoadJob:
+    # Serializes the report to Parquet in memory once and submits it as a
+    # columnar load job.
+    buffer = io.BytesIO()
+    pq.write_table(report_to_arrow(df, schema), buffer)
+    buffer.seek(0)
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=schema,
+        write_disposition=write_disposition,
     )
-    df = df[df["_merge"] == "left_only"].drop(columns=["_merge"])
-    return df
+    load_job = client.load_table_from_file(buffer, table_id, job_config=job_config)
+    return load_job.result()
 
 
-def load_data_to_bigquery(df, project_id, table_id, schema, composite_primary_key):
-    df = check_existing_bigquery(df, project_id, table_id, composite_primary_key)
-    # Load data to BigQuery
-    if df.empty:
+def create_temporary_table(client, table_id, schema) -> str:
+    temporary_table_id = f"{table_id}_tmp_{uuid.uuid4().hex}"
+    table = bigquery.Table(temporary_table_id, schema=schema)
+    table.expires = arrow.utcnow().datetime + TEMPORARY_TABLE_EXPIRATION
+    client.create_table(table)
+    return temporary_table_id
+
+
+def load_to_temporary_table(client, df, table_id, schema) -> str:
+    temporary_table_id = create_temporary_table(client, table_id, schema)
+    load_parquet_to_bigquery(client, df, temporary_table_id, schema)
+    return temporary_table_id
+
+
+def merge_table_to_bigquery(
+    client, source_table_id, table_id, composite_primary_key, start_date, end_date
+) -> None:
+    # Inserts the rows of the source table whose composite key is not in the
+    # table yet, the key comparison runs inside BigQuery so no existing keys
+    # are downloaded.
+    date_key = composite_primary_key[0]
+    on_clause = " AND ".join(
+        f"target.{key} = source.{key}" for key in composite_primary_key
+    )
+    # Restricting the target dates lets BigQuery prune partitions
+    query = f"""
+    MERGE `{table_id}` AS target
+    USING `{source_table_id}` AS source
+    ON target.{date_key} BETWEEN '{start_date.strftime('%Y-%m-%d')}' AND '{end_date.strftime('%Y-%m-%d')}'
+        AND {on_clause}
+    WHEN NOT MATCHED THEN
+        INSERT ROW
+    """
+    query_job = client.query(query)
+    query_job.result()
+    if not query_job.num_dml_affected_rows:
         logger.info("No new data to insert into BigQuery")
         return
-    pandas_gbq.to_gbq(
-        df,
-        table_id,
-        project_id,
-        table_schema=[_.to_api_repr() for _ in schema],
-        if_exists="append",
+    logger.info(
+        f"{query_job.num_dml_affected_rows} rows successfully merged into BigQuery"
     )
+
+
+def overwrite_table_to_bigquery(
+    client,
+    source_table_id,
+    table_id,
+    schema,
+    composite_primary_key,
+    start_date,
+    end_date,
+) -> None:
+    # Replaces the stored rows of every (date, account) pair present in the
+    # source table in one transaction, so reruns refresh corrected metrics.
+    # The table is partitioned by month, so truncating whole partitions would
+    # also drop the days and accounts the source does not cover.
+    date_key, account_key = composite_primary_key[:2]
+    columns = ", ".join(field.name for field in schema)
+    query = f"""
+    BEGIN TRANSACTION;
+
+    DELETE FROM `{table_id}` AS target
+    WHERE target.{date_key} BETWEEN '{start_date.strftime('%Y-%m-%d')}' AND '{end_date.strftime('%Y-%m-%d')}'
+        AND EXISTS (
+            SELECT 1
+            FROM `{source_table_id}` AS source
+            WHERE source.{date_key} = target.{date_key}
+                AND source.{account_key} = target.{account_key}
+        );
+
+    INSERT INTO `{table_id}` ({columns})
+    SELECT {columns}
+    FROM `{source_table_id}`;
+
+    COMMIT TRANSACTION;
+    """
+    client.query(query).result()
+
+
+def merge_data_to_bigquery(table, project_id, table_id, schema, composite_primary_key):
+    start_date, end_date = get_date_range(table, composite_primary_key[0])
+    client = get_bigquery_client(project_id)
+    temporary_table_id = load_to_temporary_table(client, table, table_id, schema)
+    try:
+        merge_table_to_bigquery(
+            client,
+            temporary_table_id,
+            table_id,
+            composite_primary_key,
+            start_date,
+            end_date,
+        )
+    finally:
+        client.delete_table(temporary_table_id, not_found_ok=True)
+
+
+def overwrite_data_to_bigquery(
+    table, project_id, table_id, schema, composite_primary_key
+):
+    start_date, end_date = get_date_range(table, composite_primary_key[0])
+    client = get_bigquery_client(project_id)
+    temporary_table_id = load_to_temporary_table(client, table, table_id, schema)
+    try:
+        overwrite_table_to_bigquery(
+            client,
+            temporary_table_id,
+            table_id,
+            schema,
+            composite_primary_key,
+            start_date,
+            end_date,
+        )
+    finally:
+        client.delete_table(temporary_table_id, not_found_ok=True)
+    logger.info(f"{table.num_rows} rows successfully overwritten in BigQuery")
+
+
+def load_data_to_bigquery(
+    df,
+    project_id,
+    table_id,
+    schema,
+    composite_primary_key,
+    load_mode: LoadMode = LoadMode.dedup,
+):
+    # Takes a DataFrame or an Arrow table, either is converted to an Arrow
+    # table with the BigQuery column types once and loaded from there.
+    table = report_to_arrow(df, schema)
+    if load_mode == LoadMode.merge:
+        merge_data_to_bigquery(
+            table, project_id, table_id, schema, composite_primary_key
+        )
+        return
+    if load_mode == LoadMode.overwrite:
+        overwrite_data_to_bigquery(
+            table, project_id, table_id, schema, composite_primary_key
+        )
+        return
+    table = check_existing_bigquery(table, project_id, table_id, composite_primary_key)
+    # Load data to BigQuery
+    if not table.num_rows:
+        logger.info("No new data to insert into BigQuery")
+        return
+    load_parquet_to_bigquery(get_bigquery_client(project_id), table, table_id, schema)
     logger.info("Data successfully inserted into BigQuery")
 
 
-def export_to_parquet(df, type, output_dir: Path):
-    output_dir.mkdir(parents=True, exist_ok=True)
-    file_path = output_dir.joinpath(
-        f"{type}_report_{arrow.now().format('YYYYMMDD_HHmmss')}.parquet"
+def write_reports(
+    reports: list[pd.DataFrame | pa.Table],
+    kind: str,
+    export_dir: Path,
+    bq_project_id: str,
+    bq_table_id: str,
+    schema: list,
+    composite_primary_key: tuple,
+    export: bool = False,
+    load_mode: LoadMode = LoadMode.dedup,
+) -> None:
+    if not reports:
+        logger.info(f"No {kind} reports found.")
+        return
+    # Each report is converted on its own, concatenating the tables only
+    # gathers their chunks without copying the columns.
+    table = pa.concat_tables([report_to_arrow(report, schema) for report in reports])
+    if export:
+        # Keeps the lake rows of accounts that failed to fetch in this run
+        write_to_lake(
+            table, export_dir, composite_primary_key, composite_primary_key[1]
+        )
+    load_data_to_bigquery(
+        table,
+        bq_project_id,
+        bq_table_id,
+        schema,
+        composite_primary_key,
+        load_mode,
+    )
+
+
+def load_lake_to_bigquery(
+    kind: str,
+    start_date: str,
+    end_date: str,
+    export_dir: Path,
+    bq_project_id: str,
+    bq_table_id: str,
+    schema: list,
+    composite_primary_key: tuple,
+    export: bool = False,
+    load_mode: LoadMode = LoadMode.dedup,
+    dry_run: bool = False,
+) -> None:
+    # Loads the reports exported to the lake without calling the ad APIs.
+    # Takes the same arguments as write_reports, the export flag is ignored
+    # since the rows already come from the lake. The lake table is loaded as
+    # it is read, without a round trip through pandas.
+    table = read_lake(export_dir, start_date, end_date)
+    logger.info(f"Read {table.num_rows} {kind} rows from {export_dir}")
+    if dry_run:
+        logger.info("Dry running. Not making any changes")
+        return
+    write_reports(
+        [table] if table.num_rows else [],
+        kind,
+        export_dir,
+        bq_project_id,
+        bq_table_id,
+        schema,
+        composite_primary_key,
+        export=False,
+        load_mode=load_mode,
     )
-    df.to_parquet(file_path)
-    logger.info(f"Data successfully exported to {file_path}")
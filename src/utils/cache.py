@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import re
+from pathlib import Path
+
+import arrow
+import pandas as pd
+import pandas_gbq
+import typer
+from loguru import logger
+
+from utils.bq_helper import get_bigquery_client
+
+ROOT_DIR = Path(__file__).absolute().parent.parent.parent
+
+CACHE_DIR = ROOT_DIR / "cache"
+
+app = typer.Typer(help="Manage Local Caches")
+
+
+def get_cache_name(table_id) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", table_id)
+
+
+def read_cache_metadata(name) -> dict | None:
+    metadata_path = CACHE_DIR / f"{name}.json"
+    if not metadata_path.exists():
+        return None
+    return json.loads(metadata_path.read_text())
+
+
+def write_cache_metadata(name, metadata: dict) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    (CACHE_DIR / f"{name}.json").write_text(json.dumps(metadata))
+
+
+def read_json_cache(name, ttl_hours: float):
+    # Returns the cached data, or None when missing or older than ttl_hours
+    metadata = read_cache_metadata(name)
+    if metadata is None:
+        return None
+    if arrow.utcnow() >= arrow.get(metadata["cached_at"]).shift(hours=ttl_hours):
+        return None
+    return metadata["data"]
+
+
+def write_json_cache(name, data) -> None:
+    write_cache_metadata(name, {"cached_at": arrow.utcnow().isoformat(), "data": data})
+
+
+def invalidate_cache(name=None) -> None:
+    # Removes one cache entry, or every entry when no name is given
+    pattern = f"{name}.*" if name is not None else "*"
+    for path in CACHE_DIR.glob(pattern):
+        path.unlink()
+        logger.info(f"Removed {path}")
+
+
+def read_lookup_table(
+    table_id, project_id, ttl_hours: float, refresh: bool = False
+) -> pd.DataFrame | None:
+    # Serves the lookup table from a local Parquet copy. Within the TTL no
+    # request is made; after it, the table's last-modified time is compared
+    # with the cached one (a metadata call, not a query) and the table is only
+    # downloaded again when it has changed.
+    name = get_cache_name(table_id)
+    cache_path = CACHE_DIR / f"{name}.parquet"
+    metadata = read_cache_metadata(name)
+    now = arrow.utcnow()
+    modified = None
+    if not refresh and metadata is not None and cache_path.exists():
+        if now < arrow.get(metadata["cached_at"]).shift(hours=ttl_hours):
+            logger.info(f"Using cached lookup table {table_id}")
+            return pd.read_parquet(cache_path)
+        modified = get_bigquery_client(project_id).get_table(table_id).modified
+        if arrow.get(modified) <= arrow.get(metadata["modified"]):
+            logger.info(f"Lookup table {table_id} unchanged, renewing cache")
+            write_cache_metadata(name, {**metadata, "cached_at": now.isoformat()})
+            return pd.read_parquet(cache_path)
+
+    if modified is None:
+        modified = get_bigquery_client(project_id).get_table(table_id).modified
+    lookup_df = pandas_gbq.read_gbq(table_id, project_id)
+    if lookup_df is None:
+        return None
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    lookup_df.to_parquet(cache_path)
+    write_cache_metadata(
+        name,
+        {
+            "table_id": table_id,
+            "cached_at": now.isoformat(),
+            "modified": arrow.get(modified).isoformat(),
+        },
+    )
+    logger.info(f"Cached lookup table {table_id}")
+    return lookup_df
+
+
+@app.command()
+def clear(name: str | None = None) -> None:
+    # Accepts a cache name or the BigQuery table id of a cached lookup table
+    invalidate_cache(get_cache_name(name) if name is not None else None)
+
+
+if __name__ == "__main__":
+    app()
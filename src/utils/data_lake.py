@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import uuid
+from enum import Enum
+from pathlib import Path
+
+import arrow
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import typer
+from loguru import logger
+from pyarrow import fs
+
+ROOT_DIR = Path(__file__).absolute().parent.parent.parent
+
+LAKE_DIR = ROOT_DIR / "data_lake"
+
+# Lake directory of every report table
+LAKE_TABLES = {
+    "google": LAKE_DIR / "google_ads/campaign",
+    "google_conversion": LAKE_DIR / "google_ads/conversion_goal",
+    "tiktok": LAKE_DIR / "tiktok_ads",
+}
+
+LAKE_PARTITION_KEY = "date"
+LAKE_BASENAME_TEMPLATE = "part-{i}.parquet"
+LAKE_COMPRESSION = "zstd"
+# A day of reports fits in one row group, large backfill days still get
+# row groups big enough for efficient scans.
+LAKE_ROW_GROUP_ROWS = 128 * 1024
+LAKE_FILE_ROWS = 8 * LAKE_ROW_GROUP_ROWS
+
+app = typer.Typer(help="Manage the Local Parquet Data Lake")
+
+
+class ReportSource(str, Enum):
+    # api: fetch the reports from the ad platform
+    # lake: read the reports exported to the local data lake
+    api = "api"
+    lake = "lake"
+
+
+def lake_partitioning() -> ds.Partitioning:
+    # Hive style date=YYYY-MM-DD directories, so date filters prune whole
+    # directories before any file is opened.
+    return ds.partitioning(
+        pa.schema([(LAKE_PARTITION_KEY, pa.date32())]), flavor="hive"
+    )
+
+
+def lake_write_options() -> ds.ParquetFileWriteOptions:
+    return ds.ParquetFileFormat().make_write_options(
+        compression=LAKE_COMPRESSION,
+        write_statistics=True,
+        write_page_index=True,
+    )
+
+
+def partition_dir(lake_dir: Path, date) -> Path:
+    return lake_dir / f"{LAKE_PARTITION_KEY}={date.strftime('%Y-%m-%d')}"
+
+
+def part_file_name(index: int) -> str:
+    return LAKE_BASENAME_TEMPLATE.format(i=index)
+
+
+def drop_accounts(table: pa.Table, account_key: str, accounts) -> pa.Table:
+    column = table[account_key]
+    accounts = pa.array(list(accounts), column.type)
+    return table.filter(pc.invert(pc.is_in(column, value_set=accounts)))
+
+
+def read_other_accounts(
+    table: pa.Table, lake_dir: Path, account_key: str
+) -> pa.Table | None:
+    # Previous lake rows of the table's dates whose account is not in the
+    # table, such as accounts that failed to fetch in this run
+    files = [
+        str(path)
+        for date in pc.unique(table[LAKE_PARTITION_KEY]).to_pylist()
+        for path in sorted(partition_dir(lake_dir, date).glob("*.parquet"))
+    ]
+    if not files:
+        return None
+    existing = ds.dataset(
+        files,
+        format="parquet",
+        partitioning=lake_partitioning(),
+        partition_base_dir=str(lake_dir),
+    ).to_table()
+    existing = drop_accounts(
+        existing, account_key, pc.unique(table[account_key]).to_pylist()
+    )
+    return existing.select(table.column_names).cast(table.schema)
+
+
+def write_to_lake(
+    table: pa.Table, lake_dir: Path, sort_keys=(), account_key: str | None = None
+) -> None:
+    # Rewrites every date partition present in the table with the same
+    # part-N file names, so rerunning a day replaces its files instead of
+    # adding new ones. With an account_key, the previous rows of accounts
+    # missing from the table are rewritten with it. Sorting clusters
+    # accounts and campaigns, which keeps the row group statistics selective.
+    if not table.num_rows:
+        return
+    if account_key is not None:
+        existing = read_other_accounts(table, lake_dir, account_key)
+        if existing is not None and existing.num_rows:
+            table = pa.concat_tables([table, existing])
+    sort_keys = [key for key in sort_keys if key != LAKE_PARTITION_KEY]
+    if sort_keys:
+        table = table.sort_by([(key, "ascending") for key in sort_keys])
+    ds.write_dataset(
+        table,
+        lake_dir,
+        format="parquet",
+        partitioning=lake_partitioning(),
+        basename_template=LAKE_BASENAME_TEMPLATE,
+        existing_data_behavior="delete_matching",
+        file_options=lake_write_options(),
+        min_rows_per_group=LAKE_ROW_GROUP_ROWS,
+        max_rows_per_group=LAKE_ROW_GROUP_ROWS,
+        max_rows_per_file=LAKE_FILE_ROWS,
+    )
+    logger.info(f"Data successfully exported to {lake_dir}")
+
+
+class LakeWriter:
+    """Incremental writer for the lake layout of write_to_lake.
+
+    Rows are buffered per date partition and appended to that partition's
+    Parquet file a full row group at a time, or once `buffer_rows` rows are
+    buffered across all dates so long runs stay bounded in memory (the
+    smaller row groups are merged by `compact_lake`). Files are written under a
+    temporary name and replace the partition's previous files on `close`,
+    so an interrupted run never leaves a partially rewritten day behind.
+    With an `account_key`, the previous rows of accounts this writer did not
+    write are carried over, for runs that only fetch some of the accounts.
+    """
+
+    def __init__(
+        self,
+        lake_dir: Path,
+        buffer_rows: int = LAKE_ROW_GROUP_ROWS,
+        account_key: str | None = None,
+    ) -> None:
+        self.lake_dir = lake_dir
+        self.buffer_rows = buffer_rows
+        self.account_key = account_key
+        self._accounts = set()
+        self._token = uuid.uuid4().hex
+        self._buffers = {}
+        self._buffered = {}
+        self._writers = {}
+        self._written = {}
+
+    def write(self, table: pa.Table) -> None:
+        if self.account_key is not None:
+            self._accounts.update(pc.unique(table[self.account_key]).to_pylist())
+        dates = table.column(LAKE_PARTITION_KEY)
+        for date in pc.unique(dates).to_pylist():
+            rows = table.filter(pc.equal(dates, pa.scalar(date, dates.type)))
+            self._buffers.setdefault(date, []).append(
+                rows.drop_columns(LAKE_PARTITION_KEY)
+            )
+            self._buffered[date] = self._buffered.get(date, 0) + rows.num_rows
+            if self._buffered[date] >= LAKE_ROW_GROUP_ROWS:
+                self._write_row_groups(date)
+        if sum(self._buffered.values()) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        for date in list(self._buffers):
+            self._write_row_groups(date)
+
+    def _write_row_groups(self, date) -> None:
+        table = pa.concat_tables(self._buffers.pop(date, []))
+        self._buffered.pop(date, None)
+        if not table.num_rows:
+            return
+        if date not in self._writers or self._written[date] >= LAKE_FILE_ROWS:
+            self._open_file(date, table.schema)
+        self._writers[date][-1].write_table(table, row_group_size=LAKE_ROW_GROUP_ROWS)
+        self._written[date] += table.num_rows
+
+    def _open_file(self, date, schema: pa.Schema) -> None:
+        writers = self._writers.setdefault(date, [])
+        output_dir = partition_dir(self.lake_dir, date)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        file_path = output_dir / f".{part_file_name(len(writers))}.{self._token}"
+        writers.append(
+            pq.ParquetWriter(
+                file_path,
+                schema,
+                compression=LAKE_COMPRESSION,
+                write_statistics=True,
+                write_page_index=True,
+            )
+        )
+        self._written[date] = 0
+
+    def _keep_other_accounts(self, date) -> None:
+        # Appends the partition's previous rows of the accounts not written
+        # by this run, before close replaces its files
+        files = sorted(partition_dir(self.lake_dir, date).glob("*.parquet"))
+        if not files:
+            return
+        schema = self._writers[date][-1].schema
+        table = ds.dataset(files, format="parquet").to_table().select(schema.names)
+        table = drop_accounts(table, self.account_key, self._accounts)
+        if table.num_rows:
+            self._buffers[date] = [table.cast(schema)]
+            self._write_row_groups(date)
+
+    def close(self) -> None:
+        self.flush()
+        if self.account_key is not None:
+            for date in list(self._writers):
+                self._keep_other_accounts(date)
+        for date, writers in self._writers.items():
+            for writer in writers:
+                writer.close()
+            output_dir = partition_dir(self.lake_dir, date)
+            temporary_paths = [
+                output_dir / f".{part_file_name(index)}.{self._token}"
+                for index in range(len(writers))
+            ]
+            for path in output_dir.iterdir():
+                if path not in temporary_paths:
+                    path.unlink()
+            for index, path in enumerate(temporary_paths):
+                os.replace(path, output_dir / part_file_name(index))
+        if self._writers:
+            logger.info(f"Data successfully exported to {self.lake_dir}")
+        self._writers = {}
+        self._accounts = set()
+
+    def abort(self) -> None:
+        # Drops the temporary files and keeps the previous partitions
+        for date, writers in self._writers.items():
+            for writer in writers:
+                writer.close()
+            for index in range(len(writers)):
+                output_dir = partition_dir(self.lake_dir, date)
+                (output_dir / f".{part_file_name(index)}.{self._token}").unlink(
+                    missing_ok=True
+                )
+        self._buffers = {}
+        self._buffered = {}
+        self._writers = {}
+        self._accounts = set()
+
+
+def read_lake(lake_dir: Path, start_date, end_date) -> pa.Table:
+    # Opens only the partitions of the requested days, the files are memory
+    # mapped so the scan reads straight from the page cache.
+    files = []
+    missing_days = 0
+    for day in arrow.Arrow.range("day", arrow.get(start_date), arrow.get(end_date)):
+        day_files = sorted(partition_dir(lake_dir, day).glob("*.parquet"))
+        if not day_files:
+            missing_days += 1
+        files.extend(str(path) for path in day_files)
+    if missing_days:
+        logger.warning(f"{missing_days} days are missing from {lake_dir}")
+    if not files:
+        return pa.table({})
+    return ds.dataset(
+        files,
+        format="parquet",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+        partitioning=lake_partitioning(),
+        partition_base_dir=str(lake_dir),
+    ).to_table()
+
+
+def compact_lake(lake_dir: Path) -> None:
+    # Rewrites the partitions that hold more than one file, or row groups
+    # smaller than the target size that could be merged.
+    for path in sorted(lake_dir.glob(f"{LAKE_PARTITION_KEY}=*")):
+        files = sorted(path.glob("*.parquet"))
+        if not files:
+            continue
+        row_groups = sum(pq.ParquetFile(file).num_row_groups for file in files)
+        rows = sum(pq.ParquetFile(file).metadata.num_rows for file in files)
+        if len(files) == 1 and row_groups <= -(-rows // LAKE_ROW_GROUP_ROWS):
+            continue
+        # Read the partition fully before write_to_lake deletes its files
+        table = ds.dataset(
+            files,
+            format="parquet",
+            partitioning=lake_partitioning(),
+            partition_base_dir=str(lake_dir),
+        ).to_table()
+        write_to_lake(table, lake_dir)
+        logger.info(
+            f"Compacted {path.name}: {len(files)} files and {row_groups} "
+            f"row groups into {-(-rows // LAKE_FILE_ROWS)} files"
+        )
+
+
+@app.command()
+def compact(table: str | None = None) -> None:
+    # Compacts one lake table, or every table when no name is given
+    tables = [table] if table is not None else list(LAKE_TABLES)
+    for name in tables:
+        if name not in LAKE_TABLES:
+            logger.error(f"Unknown lake table {name}, use one of {list(LAKE_TABLES)}")
+            continue
+        compact_lake(LAKE_TABLES[name])
+
+
+if __name__ == "__main__":
+    app()
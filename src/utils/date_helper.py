@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import arrow
+import typer
+
+
+def check_date_range(start_date: str, end_date: str) -> None:
+    # A reversed range yields no windows, which would look like a successful
+    # run that loaded nothing.
+    if arrow.get(start_date) > arrow.get(end_date):
+        raise typer.BadParameter(
+            f"start_date {start_date} is after end_date {end_date}"
+        )
+
+
+def get_date_windows(
+    start_date: str, end_date: str, window_days: int
+) -> list[tuple[arrow.Arrow, arrow.Arrow]]:
+    # Splits the inclusive date range into consecutive windows of at most
+    # window_days days, each given as its (first day, last day).
+    window_days = max(window_days, 1)
+    window_start = arrow.get(start_date, tzinfo="local").floor("day")
+    last_day = arrow.get(end_date, tzinfo="local").floor("day")
+    windows = []
+    while window_start <= last_day:
+        window_end = min(window_start.shift(days=window_days - 1), last_day)
+        windows.append((window_start, window_end))
+        window_start = window_end.shift(days=1)
+    return windows
+
+
+def split_date_range(start_date: str, end_date: str) -> list[tuple[str, str]]:
+    # Splits an inclusive range of at least two days into two halves
+    start = arrow.get(start_date)
+    middle = start.shift(days=(arrow.get(end_date) - start).days // 2)
+    return [
+        (start_date, middle.format("YYYY-MM-DD")),
+        (middle.shift(days=1).format("YYYY-MM-DD"), end_date),
+    ]
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import pyarrow as pa
+from attrs import frozen
+
+from utils.schemas import ReportFormat, compact_report, compact_report_table
+from utils.transform_pool import TransformPool
+
+
+@frozen
+class FetchOptions:
+    """How the report fetchers query, transform and hold their reports.
+
+    Pandas transforms run in the `transform_pool` worker processes when one
+    is given, the fetch workers only wait on them. The arrow report format
+    transforms on the fetch workers instead, its compute kernels release
+    the GIL. `search_stream` only applies to Google Ads.
+    """
+
+    search_stream: bool = True
+    transform_pool: TransformPool | None = None
+    report_format: ReportFormat = ReportFormat.pandas
+    compact: bool = False
+
+    def finish_report(self, report: pd.DataFrame | pa.Table):
+        # Converts a transformed report to the compact representation if asked
+        if not self.compact:
+            return report
+        if isinstance(report, pa.Table):
+            return compact_report_table(report)
+        return compact_report(report)
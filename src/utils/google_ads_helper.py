@@ -1,19 +1,140 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import array
 import os
+import random
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from operator import itemgetter
+from operator import attrgetter, itemgetter
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import requests
 from google.ads.googleads.client import GoogleAdsClient
 from google.ads.googleads.errors import GoogleAdsException
+from loguru import logger
+
+from utils.cache import get_cache_name, read_json_cache, write_json_cache
 
 ROOT_DIR = Path(__file__).absolute().parent.parent.parent
 
+HIERARCHY_CACHE_NAME = "google_ads_hierarchy"
+
+# array.array typecodes for the numeric report columns
+ARRAY_TYPECODES = {int: "q", float: "d"}
+
+QUOTA_RETRY_ATTEMPTS = 5
+QUOTA_RETRY_BASE_DELAY = 2.0
+
+
+def get_quota_retry_delay(exception: GoogleAdsException) -> float | None:
+    # Returns the delay suggested by the API if the failure is a quota error,
+    # or None if the failure should not be retried.
+    for error in exception.failure.errors:
+        # Works for both proto-plus wrappers and raw protobuf messages.
+        error = getattr(error, "_pb", error)
+        if error.error_code.WhichOneof("error_code") != "quota_error":
+            continue
+        quota_error_details = error.details.quota_error_details
+        if quota_error_details.HasField("retry_delay"):
+            return quota_error_details.retry_delay.ToTimedelta().total_seconds()
+        return 0.0
+    return None
+
+
+def call_with_quota_retry(
+    func,
+    *args,
+    max_attempts: int = QUOTA_RETRY_ATTEMPTS,
+    base_delay: float = QUOTA_RETRY_BASE_DELAY,
+    **kwargs,
+):
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except GoogleAdsException as e:
+            retry_delay = get_quota_retry_delay(e)
+            if retry_delay is None or attempt == max_attempts:
+                raise
+            # Exponential backoff with jitter, never shorter than what the
+            # API asked for.
+            delay = max(retry_delay, base_delay * 2 ** (attempt - 1))
+            delay += random.uniform(0, base_delay)
+            logger.warning(
+                f"Quota exhausted (request_id {e.request_id}), "
+                f"retrying in {delay:.1f}s ({attempt}/{max_attempts})"
+            )
+            time.sleep(delay)
+
+
+def iter_search_batches(googleads_service, customer_id, query, search_stream=True):
+    # search_stream sends every row over a single streamed response and yields
+    # its batches as they arrive, search pages through the results instead.
+    if search_stream:
+        stream = googleads_service.search_stream(customer_id=customer_id, query=query)
+        for batch in stream:
+            yield batch.results
+    else:
+        yield googleads_service.search(customer_id=customer_id, query=query)
+
+
+def collect_row_columns(rows, columns: dict, dtypes: dict) -> list:
+    # Collects the rows column by column: numeric fields go into typed
+    # arrays, everything else into plain lists. A single attrgetter resolves
+    # every field path of a row in one call.
+    getter = attrgetter(*columns.values())
+    values = [
+        array.array(ARRAY_TYPECODES[dtypes[name]])
+        if dtypes.get(name) in ARRAY_TYPECODES
+        else []
+        for name in columns
+    ]
+    appenders = [column.append for column in values]
+    for row in rows:
+        # Read from the underlying protobuf message to skip the proto-plus
+        # wrappers, rows are already raw messages when use_proto_plus=False.
+        row = getattr(row, "_pb", row)
+        for append, value in zip(appenders, getter(row)):
+            append(value)
+    return values
+
+
+def rows_to_dataframe(rows, columns: dict, dtypes: dict) -> pd.DataFrame:
+    # The frame is created once from the collected columns
+    values = collect_row_columns(rows, columns, dtypes)
+    if not values or not len(values[0]):
+        return pd.DataFrame()
+    return pd.DataFrame(
+        {
+            name: np.frombuffer(column, dtype=column.typecode)
+            if isinstance(column, array.array)
+            else column
+            for name, column in zip(columns, values)
+        }
+    )
+
+
+def rows_to_table(rows, columns: dict, dtypes: dict) -> pa.Table:
+    # Arrow version of rows_to_dataframe, the typed arrays are wrapped without
+    # copying and string fields go straight into Arrow buffers instead of
+    # Python object columns.
+    values = collect_row_columns(rows, columns, dtypes)
+    if not values or not len(values[0]):
+        return pa.table({})
+    return pa.table(
+        {
+            name: pa.array(np.frombuffer(column, dtype=column.typecode))
+            if isinstance(column, array.array)
+            else pa.array(column)
+            for name, column in zip(columns, values)
+        }
+    )
+
 
 def get_managers(googleads_service, customer_service) -> list:
     # A collection of customer IDs to handle.
@@ -29,7 +150,28 @@ def get_managers(googleads_service, customer_service) -> list:
     return seed_customer_ids
 
 
-def get_clients(googleads_service, seed_customer_ids) -> pd.DataFrame:
+def search_customer_clients(googleads_service, customer_id, query) -> list:
+    try:
+        return call_with_quota_retry(
+            lambda: list(googleads_service.search(customer_id=customer_id, query=query))
+        )
+    except GoogleAdsException as e:
+        logger.error(f"Failed to list child accounts of {customer_id}: {e}")
+        return None
+
+
+def get_clients(googleads_service, seed_customer_ids, concurrency=1) -> pd.DataFrame:
+    manager_client_map, _ = walk_customer_clients(
+        googleads_service, seed_customer_ids, concurrency
+    )
+    return manager_client_map_to_df(manager_client_map)
+
+
+def walk_customer_clients(
+    googleads_service, seed_customer_ids, concurrency=1
+) -> tuple[dict, list]:
+    # Returns the manager -> clients map and the managers whose child
+    # accounts could not be listed, the map is partial when any failed.
     # Creates a query that retrieves all child accounts of the manager
     # specified in search calls below.
     query = """
@@ -44,57 +186,54 @@ def get_clients(googleads_service, seed_customer_ids) -> pd.DataFrame:
         FROM customer_client
         WHERE customer_client.level <= 1"""
 
-    for seed_customer_id in seed_customer_ids:
-        # Performs a breadth-first search to build a Dictionary that maps
-        # managers to their child accounts (customerIdsToChildAccounts).
-        unprocessed_customer_ids = [seed_customer_id]
-        manager_client_map = dict()
-        root_customer_client = None
-
+    # Performs a breadth-first search to build a Dictionary that maps
+    # managers to their child accounts. The managers of each level of the
+    # hierarchy are queried concurrently.
+    manager_client_map = dict()
+    # A customer can be managed by multiple managers, so to prevent
+    # visiting the same customer many times, we keep track of the visited
+    # managers.
+    unprocessed_customer_ids = list(dict.fromkeys(map(str, seed_customer_ids)))
+    visited_customer_ids = set(unprocessed_customer_ids)
+    failed_customer_ids = []
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
         while unprocessed_customer_ids:
-            customer_id = unprocessed_customer_ids.pop(0)
-            response = googleads_service.search(customer_id=customer_id, query=query)
-
-            # Iterates over all rows in all pages to get all customer
-            # clients under the specified customer's hierarchy.
-            for googleads_row in response:
-                customer_client = googleads_row.customer_client
-
-                # The customer client that with level 0 is the specified
-                # customer.
-                if customer_client.level == 0:
-                    if root_customer_client is None:
-                        root_customer_client = customer_client
+            responses = executor.map(
+                lambda customer_id: search_customer_clients(
+                    googleads_service, customer_id, query
+                ),
+                unprocessed_customer_ids,
+            )
+            next_customer_ids = []
+            for customer_id, response in zip(unprocessed_customer_ids, responses):
+                if response is None:
+                    failed_customer_ids.append(customer_id)
                     continue
+                for googleads_row in response:
+                    customer_client = googleads_row.customer_client
 
-                # For all level-1 (direct child) accounts that are a
-                # manager account, the above query will be run against them
-                # to create a Dictionary of managers mapped to their child
-                # accounts for printing the hierarchy afterwards.
-                if customer_id not in manager_client_map:
-                    manager_client_map[customer_id] = []
-
-                manager_client_map[customer_id].append(customer_client)
-
-                if customer_client.manager:
-                    # A customer can be managed by multiple managers, so to
-                    # prevent visiting the same customer many times, we
-                    # need to check if it's already in the Dictionary.
-                    if (
-                        customer_client.id not in manager_client_map
-                        and customer_client.level == 1
-                    ):
-                        unprocessed_customer_ids.append(customer_client.id)
-
-            manager_client_map[customer_id] = list(
-                map(
-                    lambda x: x.id if not x.manager else None,
-                    manager_client_map[seed_customer_id],
-                )
-            )
+                    # The customer client that with level 0 is the specified
+                    # customer.
+                    if customer_client.level == 0:
+                        continue
 
+                    # Level-1 manager accounts are queried on the next level,
+                    # other accounts are the clients we report on.
+                    client_id = str(customer_client.id)
+                    if customer_client.manager:
+                        if client_id not in visited_customer_ids:
+                            visited_customer_ids.add(client_id)
+                            next_customer_ids.append(client_id)
+                        continue
+                    manager_client_map.setdefault(customer_id, []).append(client_id)
+            unprocessed_customer_ids = next_customer_ids
+
+    return manager_client_map, failed_customer_ids
+
+
+def manager_client_map_to_df(manager_client_map: dict) -> pd.DataFrame:
     manager_client_map = [
-        (manager_id, str(client_id))
+        (manager_id, client_id)
         for manager_id, client_ids in manager_client_map.items()
         for client_id in client_ids
     ]
@@ -104,4 +243,45 @@ def get_clients(googleads_service, seed_customer_ids) -> pd.DataFrame:
         columns=["manager_id", "client_id"],
     )
 
-    return df_client
+    # Clients linked to several managers are only reported once
+    return df_client.drop_duplicates("client_id").reset_index(drop=True)
+
+
+def get_hierarchy_cache_name(login_customer_id) -> str:
+    # Each login customer only sees the managers it has been granted
+    return get_cache_name(f"{HIERARCHY_CACHE_NAME}_{login_customer_id}")
+
+
+def get_account_hierarchy(
+    googleads_service,
+    customer_service,
+    login_customer_id,
+    refresh_hours: float,
+    refresh: bool = False,
+    concurrency: int = 1,
+) -> pd.DataFrame:
+    # Serves the manager -> client map from the local cache while it is
+    # younger than refresh_hours, otherwise walks the hierarchy again.
+    cache_name = get_hierarchy_cache_name(login_customer_id)
+    if not refresh:
+        manager_client_map = read_json_cache(cache_name, refresh_hours)
+        if manager_client_map is not None:
+            logger.info("Using cached Google Ads account hierarchy")
+            return manager_client_map_to_df(manager_client_map)
+
+    manager_ids = get_managers(googleads_service, customer_service)
+    manager_client_map, failed_manager_ids = walk_customer_clients(
+        googleads_service, manager_ids, concurrency
+    )
+    # A partial or empty hierarchy is used for this run only, caching it would
+    # hide the missing accounts until the cache expires.
+    if failed_manager_ids:
+        logger.warning(
+            f"Not caching the account hierarchy, listing the child accounts of "
+            f"{len(failed_manager_ids)} managers failed: {failed_manager_ids}"
+        )
+    elif not manager_client_map:
+        logger.warning("Not caching the account hierarchy, no client accounts found")
+    else:
+        write_json_cache(cache_name, manager_client_map)
+    return manager_client_map_to_df(manager_client_map)
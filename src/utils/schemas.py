@@ -1,8 +1,44 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from enum import Enum
+
 import db_dtypes
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from google.cloud import bigquery
 
+
+class ReportFormat(str, Enum):
+    # pandas: the fetchers return DataFrames with the dtypes below
+    # arrow: the fetchers return Arrow tables with the arrow schemas below,
+    # which the lake writer and the BigQuery loader consume as they are
+    pandas = "pandas"
+    arrow = "arrow"
+
+
+# Arrow types of the BigQuery column types used by the staging tables
+bq_arrow_types = {
+    "DATE": pa.date32(),
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "FLOAT": pa.float64(),
+}
+
+
+def bq_schema_to_arrow(schema) -> pa.Schema:
+    return pa.schema(
+        [
+            pa.field(
+                field.name,
+                bq_arrow_types[field.field_type],
+                nullable=field.mode != "REQUIRED",
+            )
+            for field in schema
+        ]
+    )
+
+
 google_category_lookup_schema = [
     bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
     bigquery.SchemaField("category_name", "STRING", mode="REQUIRED"),
@@ -115,3 +151,72 @@ tiktok_schema = [
     bigquery.SchemaField("cpc", "FLOAT", mode="NULLABLE"),
     bigquery.SchemaField("cost_per_result", "FLOAT", mode="NULLABLE"),
 ]
+
+# Arrow equivalents of the report schemas, the column types of the Parquet
+# files and of the tables the arrow report format emits
+google_arrow_schema = bq_schema_to_arrow(google_schema)
+google_conversion_arrow_schema = bq_schema_to_arrow(google_conversion_schema)
+tiktok_arrow_schema = bq_schema_to_arrow(tiktok_schema)
+
+# Compact representation of the reports, an option of the fetchers for long
+# ranges. Columns repeating a few values on every date row are kept as
+# categoricals, or dictionary encoded in Arrow tables.
+COMPACT_CATEGORY_COLUMNS = [
+    "customer_id",
+    "advertiser_id",
+    "advertiser_name",
+    "currency_code",
+    "objective_type",
+    "conversion_action_name",
+    "conversion_action_category",
+]
+# One value per campaign, kept as Arrow strings instead of Python objects
+COMPACT_STRING_COLUMNS = ["campaign_id", "campaign_name", "conversion_action"]
+# Count metrics are downcast to the smallest integer type holding their
+# values. Money and ratio metrics stay float64, float32 would change the
+# values loaded into the FLOAT columns.
+COMPACT_COUNT_COLUMNS = [
+    "impressions",
+    "clicks",
+    "video_views",
+    "engagements",
+    "view_through_conversions",
+    "reach",
+    "video_play_actions",
+    "result",
+    "checkout",
+]
+
+compact_dtypes = {
+    **{name: "category" for name in COMPACT_CATEGORY_COLUMNS},
+    **{name: "string[pyarrow]" for name in COMPACT_STRING_COLUMNS},
+}
+
+
+def compact_report(df: pd.DataFrame) -> pd.DataFrame:
+    # The BigQuery loaders cast the compact columns back to the schema types
+    df = df.astype(
+        {name: dtype for name, dtype in compact_dtypes.items() if name in df}
+    )
+    for name in COMPACT_COUNT_COLUMNS:
+        if name in df and pd.api.types.is_integer_dtype(df[name]):
+            df[name] = pd.to_numeric(df[name], downcast="integer")
+    return df
+
+
+def compact_report_table(table: pa.Table) -> pa.Table:
+    # Arrow version of compact_report, count metrics are narrowed to int32
+    # when every value fits.
+    for index, name in enumerate(table.column_names):
+        column = table.column(index)
+        if name in COMPACT_CATEGORY_COLUMNS:
+            column = pc.dictionary_encode(column)
+        elif name in COMPACT_COUNT_COLUMNS and pa.types.is_int64(column.type):
+            try:
+                column = pc.cast(column, pa.int32())
+            except pa.ArrowInvalid:
+                continue
+        else:
+            continue
+        table = table.set_column(index, name, column)
+    return table
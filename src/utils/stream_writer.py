@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from loguru import logger
+
+from utils.bq_helper import (
+    LoadMode,
+    create_temporary_table,
+    get_bigquery_client,
+    get_date_range,
+    load_data_to_bigquery,
+    load_parquet_to_bigquery,
+    merge_table_to_bigquery,
+    overwrite_table_to_bigquery,
+    report_to_arrow,
+)
+from utils.data_lake import LakeWriter
+
+# Marks the end of the stream on the queue
+_DONE = object()
+
+
+class StreamWriter:
+    """Writer stage of the streaming report mode.
+
+    Producers `put` one account's report at a time on a bounded queue, so a
+    slow writer blocks the fetchers instead of piling reports up in memory.
+    Reports are DataFrames or Arrow tables, both are converted to Arrow
+    once. A single thread buffers rows until `batch_rows` are reached, then
+    appends the batch to the date partitions of the data lake and to a
+    BigQuery staging table. `close` flushes the last batch and merges or
+    overwrites the staging table into the target table in one statement,
+    the dedup mode loads every batch straight into the target instead.
+    Use it as a context manager.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        export_dir: Path,
+        bq_project_id: str,
+        bq_table_id: str,
+        schema: list,
+        composite_primary_key: tuple,
+        export: bool = False,
+        load_mode: LoadMode = LoadMode.dedup,
+        batch_rows: int = 50_000,
+        queue_size: int = 1,
+        dry_run: bool = False,
+        keep_other_accounts: bool = False,
+    ) -> None:
+        self.kind = kind
+        self.export_dir = export_dir
+        self.bq_project_id = bq_project_id
+        self.bq_table_id = bq_table_id
+        self.schema = schema
+        self.composite_primary_key = composite_primary_key
+        self.export = export
+        self.load_mode = load_mode
+        self.batch_rows = batch_rows
+        self.dry_run = dry_run
+        self.rows = 0
+        self._queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._batch = []
+        self._batch_size = 0
+        self._lake_writer = None
+        if export:
+            # The key after the date is the account, the lake keeps the rows
+            # of accounts missing from this stream when asked to
+            self._lake_writer = LakeWriter(
+                export_dir,
+                batch_rows,
+                composite_primary_key[1] if keep_other_accounts else None,
+            )
+        self._staging_table_id = None
+        self._start_date = None
+        self._end_date = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "StreamWriter":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        self.close(commit=exc_type is None)
+
+    def put(self, report: pd.DataFrame | pa.Table) -> None:
+        if len(report):
+            self._queue.put(report)
+
+    def fetch_into(self, description: str, func, *args, **kwargs) -> None:
+        # Runs one fetch task and streams its result, used as the task body
+        # on the fetch executors.
+        try:
+            df = func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Failed to get {description}: {e}")
+            return
+        self.put(df)
+
+    def close(self, commit: bool = True) -> None:
+        self._queue.put(_DONE)
+        self._thread.join()
+        try:
+            if self._error is None and commit and not self.dry_run:
+                self._finish()
+        finally:
+            self._cleanup(commit)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        while (report := self._queue.get()) is not _DONE:
+            # After a failure keep draining so producers never block
+            if self._error is not None:
+                continue
+            try:
+                self._write(report)
+            except Exception as e:
+                logger.error(f"Failed to write {self.kind} reports: {e}")
+                self._error = e
+
+    def _write(self, report: pd.DataFrame | pa.Table) -> None:
+        self.rows += len(report)
+        if self.dry_run:
+            return
+        table = report_to_arrow(report, self.schema)
+        if self._lake_writer is not None:
+            self._lake_writer.write(table)
+        start_date, end_date = get_date_range(table, self.composite_primary_key[0])
+        if self._start_date is None or start_date < self._start_date:
+            self._start_date = start_date
+        if self._end_date is None or end_date > self._end_date:
+            self._end_date = end_date
+        self._batch.append(table)
+        self._batch_size += table.num_rows
+        if self._batch_size >= self.batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        table = pa.concat_tables(self._batch)
+        self._batch = []
+        self._batch_size = 0
+        if self.load_mode == LoadMode.dedup:
+            # The dedup mode checks existing keys per load, so each batch
+            # goes straight to the target table.
+            load_data_to_bigquery(
+                table,
+                self.bq_project_id,
+                self.bq_table_id,
+                self.schema,
+                self.composite_primary_key,
+                self.load_mode,
+            )
+            return
+        client = get_bigquery_client(self.bq_project_id)
+        if self._staging_table_id is None:
+            self._staging_table_id = create_temporary_table(
+                client, self.bq_table_id, self.schema
+            )
+        load_parquet_to_bigquery(client, table, self._staging_table_id, self.schema)
+        logger.info(f"Staged {table.num_rows} {self.kind} rows for BigQuery")
+
+    def _finish(self) -> None:
+        self._flush()
+        if self._staging_table_id is None:
+            if not self.rows:
+                logger.info(f"No {self.kind} reports found.")
+            return
+        client = get_bigquery_client(self.bq_project_id)
+        if self.load_mode == LoadMode.merge:
+            merge_table_to_bigquery(
+                client,
+                self._staging_table_id,
+                self.bq_table_id,
+                self.composite_primary_key,
+                self._start_date,
+                self._end_date,
+            )
+            return
+        overwrite_table_to_bigquery(
+            client,
+            self._staging_table_id,
+            self.bq_table_id,
+            self.schema,
+            self.composite_primary_key,
+            self._start_date,
+            self._end_date,
+        )
+        logger.info(f"{self.rows} rows successfully overwritten in BigQuery")
+
+    def _cleanup(self, commit: bool) -> None:
+        if self._lake_writer is not None:
+            # Replaces the lake partitions only when the whole stream succeeded
+            if commit and self._error is None and not self.dry_run:
+                self._lake_writer.close()
+            else:
+                self._lake_writer.abort()
+        if self._staging_table_id is not None:
+            client = get_bigquery_client(self.bq_project_id)
+            client.delete_table(self._staging_table_id, not_found_ok=True)
+            self._staging_table_id = None
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+
+def dataframe_to_ipc(df: pd.DataFrame) -> pa.Buffer:
+    # Columns travel as Arrow buffers, object columns would otherwise be
+    # pickled value by value. The pandas metadata restores extension dtypes
+    # such as dbdate on the other side.
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def ipc_to_dataframe(buffer: pa.Buffer) -> pd.DataFrame:
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+def _run_transform(func, buffer: pa.Buffer, args: tuple) -> pa.Buffer:
+    return dataframe_to_ipc(func(ipc_to_dataframe(buffer), *args))
+
+
+class TransformPool:
+    """Runs the CPU bound report transforms in worker processes.
+
+    `transform(func, df, *args)` calls `func(df, *args)` in a worker and
+    ships the frames both ways as Arrow IPC streams. func must be a module
+    level function. With no workers the transform runs inline in the
+    calling thread, which is the default of every command. Workers are
+    spawned rather than forked, forking a process with live gRPC threads
+    can deadlock the child.
+    """
+
+    def __init__(self, workers: int = 0) -> None:
+        self.workers = workers
+        self._executor = (
+            ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            if workers > 0
+            else None
+        )
+
+    def __enter__(self) -> "TransformPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def submit(self, func, df: pd.DataFrame, *args) -> Future | None:
+        # Returns None when the transform has to run inline: without workers,
+        # for empty frames, or for object columns mixing types, which have
+        # no Arrow type.
+        if self._executor is None or df.empty:
+            return None
+        try:
+            buffer = dataframe_to_ipc(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None
+        return self._executor.submit(_run_transform, func, buffer, args)
+
+    def transform(self, func, df: pd.DataFrame, *args) -> pd.DataFrame:
+        future = self.submit(func, df, *args)
+        if future is None:
+            return func(df, *args)
+        return ipc_to_dataframe(future.result())
+
+    async def transform_async(self, func, df: pd.DataFrame, *args) -> pd.DataFrame:
+        future = self.submit(func, df, *args)
+        if future is None:
+            return func(df, *args)
+        return ipc_to_dataframe(await asyncio.wrap_future(future))
+
+
+def run_transform(
+    transform_pool: TransformPool | None, func, df: pd.DataFrame, *args
+) -> pd.DataFrame:
+    # Lets the fetchers take an optional pool, None runs the transform inline
+    if transform_pool is None:
+        return func(df, *args)
+    return transform_pool.transform(func, df, *args)
+
+
+async def run_transform_async(
+    transform_pool: TransformPool | None, func, df: pd.DataFrame, *args
+) -> pd.DataFrame:
+    if transform_pool is None:
+        return func(df, *args)
+    return await transform_pool.transform_async(func, df, *args)
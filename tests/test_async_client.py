@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import math
+
+import arrow
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from business_api_client.rest import ApiException
+from tiktok_ads import tiktok_ads
+from tiktok_ads.async_client import AsyncTiktokClient
+
+ACCESS_TOKEN = "test-token"
+
+
+class ReportServer:
+    """Stub of the reporting endpoint serving campaign rows per day.
+
+    Paging and page_info follow the API, the query mode is only recorded so
+    the tests can check which mode each page was requested in.
+    """
+
+    def __init__(self, campaigns_per_day: int = 0) -> None:
+        self.campaigns_per_day = campaigns_per_day
+        self.requests = []
+        self.app = web.Application()
+        self.app.router.add_get("/report/integrated/get/", self.report)
+
+    async def report(self, request: web.Request) -> web.Response:
+        self.requests.append(request)
+        query = request.query
+        days = arrow.Arrow.range(
+            "day", arrow.get(query["start_date"]), arrow.get(query["end_date"])
+        )
+        rows = [
+            {
+                "dimensions": {
+                    "stat_time_day": f"{day.format('YYYY-MM-DD')} 00:00:00",
+                    "campaign_id": str(campaign),
+                },
+                "metrics": {"spend": "1.0"},
+            }
+            for day in days
+            for campaign in range(self.campaigns_per_day)
+        ]
+        page, page_size = int(query["page"]), int(query["page_size"])
+        return web.json_response(
+            {
+                "code": 0,
+                "message": "OK",
+                "data": {
+                    "list": rows[(page - 1) * page_size : page * page_size],
+                    "page_info": {
+                        "page": page,
+                        "page_size": page_size,
+                        "total_number": len(rows),
+                        "total_page": math.ceil(len(rows) / page_size),
+                    },
+                },
+            }
+        )
+
+    def pages(self) -> list:
+        return [
+            (
+                request.query["start_date"],
+                request.query["query_mode"],
+                int(request.query["page"]),
+            )
+            for request in self.requests
+        ]
+
+
+def run_with_client(app: web.Application, func):
+    # Serves the stub app on a local port for the duration of func(client)
+    async def run():
+        async with TestServer(app) as test_server:
+            async with AsyncTiktokClient(
+                ACCESS_TOKEN, qps=1_000, base_url=str(test_server.make_url(""))
+            ) as client:
+                return await func(client)
+
+    return asyncio.run(run())
+
+
+def get_rows(server: ReportServer, start_date, end_date) -> list:
+    return run_with_client(
+        server.app,
+        lambda client: tiktok_ads.get_report_rows_async(
+            client, "123", start_date, end_date
+        ),
+    )
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    # Shrinks the page size and the query mode limits so a handful of rows
+    # exercise the paging, CHUNK fallback and date splitting
+    monkeypatch.setattr(tiktok_ads, "TIKTOK_MAX_PAGE_SIZE", 2)
+    monkeypatch.setattr(
+        tiktok_ads, "TIKTOK_QUERY_MODES", [("REGULAR", 5), ("CHUNK", 8)]
+    )
+
+
+def test_request_sends_access_token_and_json_encoded_params():
+    server = ReportServer()
+    run_with_client(
+        server.app,
+        lambda client: client.report_integrated_get(
+            "123",
+            "BASIC",
+            ["stat_time_day", "campaign_id"],
+            metrics=["spend", "clicks"],
+            filtering=None,
+            start_date="2024-01-01",
+            end_date="2024-01-01",
+            page=1,
+            page_size=10,
+            query_lifetime=False,
+        ),
+    )
+    [request] = server.requests
+    assert request.headers["Access-Token"] == ACCESS_TOKEN
+    assert json.loads(request.query["dimensions"]) == ["stat_time_day", "campaign_id"]
+    assert json.loads(request.query["metrics"]) == ["spend", "clicks"]
+    assert request.query["query_lifetime"] == "false"
+    assert request.query["page"] == "1"
+    assert "filtering" not in request.query
+
+
+def test_remaining_pages_are_walked(small_pages):
+    server = ReportServer(campaigns_per_day=5)
+    rows = get_rows(server, "2024-01-01", "2024-01-01")
+    assert [row["dimensions"]["campaign_id"] for row in rows] == list("01234")
+    assert sorted(server.pages()) == [
+        ("2024-01-01", "REGULAR", page) for page in (1, 2, 3)
+    ]
+
+
+def test_reports_over_the_regular_limit_fall_back_to_chunk(small_pages):
+    server = ReportServer(campaigns_per_day=7)
+    rows = get_rows(server, "2024-01-01", "2024-01-01")
+    assert len(rows) == 7
+    assert server.pages()[:2] == [
+        ("2024-01-01", "REGULAR", 1),
+        ("2024-01-01", "CHUNK", 1),
+    ]
+    assert sorted(server.pages()[2:]) == [
+        ("2024-01-01", "CHUNK", page) for page in (2, 3, 4)
+    ]
+
+
+def test_reports_over_the_chunk_limit_split_the_date_range(small_pages):
+    server = ReportServer(campaigns_per_day=3)
+    rows = get_rows(server, "2024-01-01", "2024-01-04")
+    days = [row["dimensions"]["stat_time_day"][:10] for row in rows]
+    assert days == sorted(days) and len(rows) == 12
+    # 12 rows exceed both limits, each two day half of 6 rows fits in CHUNK
+    first_pages = [page for page in server.pages() if page[2] == 1]
+    assert sorted(first_pages) == [
+        ("2024-01-01", "CHUNK", 1),
+        ("2024-01-01", "CHUNK", 1),
+        ("2024-01-01", "REGULAR", 1),
+        ("2024-01-01", "REGULAR", 1),
+        ("2024-01-03", "CHUNK", 1),
+        ("2024-01-03", "REGULAR", 1),
+    ]
+    assert {mode for start, mode, page in server.pages() if page > 1} == {"CHUNK"}
+
+
+@pytest.mark.parametrize("status", [400, 404, 500, 503])
+def test_http_errors_raise_api_exception(status):
+    app = web.Application()
+
+    async def error(request: web.Request) -> web.Response:
+        return web.Response(status=status, text="error")
+
+    app.router.add_get("/report/integrated/get/", error)
+    with pytest.raises(ApiException) as exc_info:
+        run_with_client(
+            app,
+            lambda client: client.report_integrated_get("123", "BASIC", []),
+        )
+    assert exc_info.value.status == status
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pytest
+from google.cloud import bigquery
+from utils import stream_writer
+from utils.backfill import BackfillLedger, UnitStatus, run_backfill_window
+from utils.bq_helper import LoadMode
+from utils.data_lake import read_lake
+from utils.stream_writer import StreamWriter
+
+SCHEMA = [
+    bigquery.SchemaField("date", "DATE"),
+    bigquery.SchemaField("customer_id", "STRING"),
+    bigquery.SchemaField("campaign_id", "STRING"),
+    bigquery.SchemaField("clicks", "INTEGER"),
+]
+
+WINDOW = ("2024-01-01", "2024-01-02")
+
+
+def make_report(account) -> pa.Table:
+    return pa.table(
+        {
+            "date": ["2024-01-01", "2024-01-01", "2024-01-02"],
+            "customer_id": [account] * 3,
+            "campaign_id": ["1", "2", "1"],
+            "clicks": [1, 2, 3],
+        }
+    )
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    # Records the BigQuery loads instead of running them
+    loads = []
+    monkeypatch.setattr(
+        stream_writer,
+        "load_data_to_bigquery",
+        lambda table, *args: loads.append(table),
+    )
+    return loads
+
+
+def run_window(ledger, lake_dir, fetch_unit):
+    def open_writers():
+        return [
+            StreamWriter(
+                "campaign",
+                lake_dir,
+                "project",
+                "project.dataset.table",
+                SCHEMA,
+                ("date", "customer_id", "campaign_id"),
+                export=True,
+                load_mode=LoadMode.dedup,
+                keep_other_accounts=True,
+            )
+        ]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        run_backfill_window(
+            ledger, "google", ["A", "B"], *WINDOW, fetch_unit, open_writers, executor
+        )
+
+
+def lake_accounts(lake_dir) -> list:
+    table = read_lake(lake_dir, *WINDOW)
+    dates = [date.isoformat() for date in table["date"].to_pylist()]
+    return sorted(zip(dates, table["customer_id"].to_pylist()))
+
+
+def test_resumed_window_keeps_lake_rows_of_done_accounts(tmp_path, loads):
+    ledger = BackfillLedger(tmp_path / "ledger.sqlite3")
+    lake_dir = tmp_path / "lake"
+
+    def fetch_first_run(account, window_start, window_end):
+        if account == "B":
+            raise RuntimeError("quota exhausted")
+        return (make_report(account),)
+
+    run_window(ledger, lake_dir, fetch_first_run)
+    statuses = ledger.get_statuses("google", *WINDOW)
+    assert statuses == {"A": UnitStatus.done, "B": UnitStatus.failed}
+
+    fetched = []
+
+    def fetch_resume(account, window_start, window_end):
+        fetched.append(account)
+        return (make_report(account),)
+
+    run_window(ledger, lake_dir, fetch_resume)
+    assert fetched == ["B"]
+    assert ledger.get_statuses("google", *WINDOW)["B"] == UnitStatus.done
+    assert [table.num_rows for table in loads] == [3, 3]
+    assert lake_accounts(lake_dir) == sorted(
+        (date, account)
+        for date in ["2024-01-01", "2024-01-01", "2024-01-02"]
+        for account in ["A", "B"]
+    )
+
+
+def test_rerun_replaces_lake_rows_of_refetched_accounts(tmp_path, loads):
+    ledger = BackfillLedger(tmp_path / "ledger.sqlite3")
+    lake_dir = tmp_path / "lake"
+
+    def fetch_unit(account, window_start, window_end):
+        return (make_report(account),)
+
+    run_window(ledger, lake_dir, fetch_unit)
+    ledger.reset("google")
+    run_window(ledger, lake_dir, fetch_unit)
+    assert len(lake_accounts(lake_dir)) == 6
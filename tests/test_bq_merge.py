@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from datetime import date
+
+import pyarrow as pa
+import pytest
+from google.cloud import bigquery
+from utils import bq_helper
+from utils.bq_helper import LoadMode, load_data_to_bigquery, merge_table_to_bigquery
+
+TABLE_ID = "project.dataset.report"
+
+SCHEMA = [
+    bigquery.SchemaField("date", "DATE"),
+    bigquery.SchemaField("customer_id", "STRING"),
+    bigquery.SchemaField("campaign_id", "STRING"),
+    bigquery.SchemaField("clicks", "INTEGER"),
+]
+
+KEY = ("date", "customer_id", "campaign_id")
+
+
+class FakeJob:
+    def __init__(self, error=None, num_dml_affected_rows=0) -> None:
+        self.error = error
+        self.num_dml_affected_rows = num_dml_affected_rows
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class FakeClient:
+    """Records the calls made to bigquery.Client by the load helpers."""
+
+    def __init__(self, query_error=None) -> None:
+        self.query_error = query_error
+        self.queries = []
+        self.created = []
+        self.loaded = []
+        self.deleted = []
+
+    def query(self, query):
+        self.queries.append(query)
+        return FakeJob(self.query_error, num_dml_affected_rows=1)
+
+    def create_table(self, table):
+        self.created.append(f"{table.project}.{table.dataset_id}.{table.table_id}")
+        return table
+
+    def load_table_from_file(self, buffer, table_id, job_config=None):
+        self.loaded.append(table_id)
+        return FakeJob()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        self.deleted.append(table_id)
+
+
+def make_table() -> pa.Table:
+    return pa.table(
+        {
+            "date": ["2024-01-03", "2024-01-01"],
+            "customer_id": ["1", "1"],
+            "campaign_id": ["10", "11"],
+            "clicks": [5, 7],
+        }
+    )
+
+
+def normalize(query) -> str:
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def test_merge_prunes_target_dates_and_matches_on_the_key():
+    client = FakeClient()
+    merge_table_to_bigquery(
+        client,
+        "project.dataset.staging",
+        TABLE_ID,
+        KEY,
+        date(2024, 1, 1),
+        date(2024, 1, 31),
+    )
+    assert [normalize(query) for query in client.queries] == [
+        f"MERGE `{TABLE_ID}` AS target "
+        "USING `project.dataset.staging` AS source "
+        "ON target.date BETWEEN '2024-01-01' AND '2024-01-31' "
+        "AND target.date = source.date "
+        "AND target.customer_id = source.customer_id "
+        "AND target.campaign_id = source.campaign_id "
+        "WHEN NOT MATCHED THEN INSERT ROW"
+    ]
+
+
+def test_merge_data_stages_the_rows_and_uses_their_date_range(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(bq_helper, "get_bigquery_client", lambda project_id: client)
+    load_data_to_bigquery(
+        make_table(), "project", TABLE_ID, SCHEMA, KEY, LoadMode.merge
+    )
+    [temporary_table_id] = client.created
+    assert temporary_table_id.startswith(f"{TABLE_ID}_tmp_")
+    assert client.loaded == [temporary_table_id]
+    [query] = client.queries
+    assert f"USING `{temporary_table_id}` AS source" in query
+    assert "BETWEEN '2024-01-01' AND '2024-01-03'" in query
+    assert client.deleted == [temporary_table_id]
+
+
+def test_merge_failure_deletes_the_temporary_table(monkeypatch):
+    client = FakeClient(query_error=RuntimeError("merge failed"))
+    monkeypatch.setattr(bq_helper, "get_bigquery_client", lambda project_id: client)
+    with pytest.raises(RuntimeError, match="merge failed"):
+        load_data_to_bigquery(
+            make_table(), "project", TABLE_ID, SCHEMA, KEY, LoadMode.merge
+        )
+    assert len(client.created) == 1
+    assert client.deleted == client.created
+
+
+def test_load_mode_defaults_to_dedup(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(bq_helper, "get_bigquery_client", lambda project_id: client)
+    monkeypatch.setattr(
+        bq_helper,
+        "check_existing_bigquery",
+        lambda table, *args: table,
+    )
+    load_data_to_bigquery(make_table(), "project", TABLE_ID, SCHEMA, KEY)
+    assert client.created == []
+    assert client.loaded == [TABLE_ID]
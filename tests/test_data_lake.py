@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+import pyarrow as pa
+from utils.data_lake import read_lake, write_to_lake
+
+KEY = ("date", "customer_id", "campaign_id")
+
+
+def make_table(accounts, clicks=1) -> pa.Table:
+    return pa.table(
+        {
+            "date": pa.array([date(2024, 1, 1)] * len(accounts), pa.date32()),
+            "customer_id": accounts,
+            "campaign_id": ["10"] * len(accounts),
+            "clicks": [clicks] * len(accounts),
+        }
+    )
+
+
+def lake_rows(lake_dir) -> list:
+    table = read_lake(lake_dir, "2024-01-01", "2024-01-01")
+    return sorted(zip(table["customer_id"].to_pylist(), table["clicks"].to_pylist()))
+
+
+def test_rerun_keeps_the_rows_of_accounts_missing_from_it(tmp_path):
+    write_to_lake(make_table(["A", "B"]), tmp_path, KEY, "customer_id")
+    # B failed to fetch on the rerun, A is replaced and B is kept
+    write_to_lake(make_table(["A"], clicks=2), tmp_path, KEY, "customer_id")
+    assert lake_rows(tmp_path) == [("A", 2), ("B", 1)]
+
+
+def test_without_an_account_key_the_partition_is_replaced(tmp_path):
+    write_to_lake(make_table(["A", "B"]), tmp_path, KEY)
+    write_to_lake(make_table(["A"], clicks=2), tmp_path, KEY)
+    assert lake_rows(tmp_path) == [("A", 2)]